@@ -3,6 +3,9 @@ from flow.controllers.base_lane_changing_controller import BaseLaneChangeControl
 from flow.controllers.base_routing_controller import BaseRouter
 import numpy as np
 
+from curbside_dynamics import idm_accel, park_accel
+from curbside_occupancy import LOOKAHEAD, assign_free_zones, search_offsets
+from curbside_state import PARKED, PARKING
 
 
 
@@ -12,8 +15,13 @@ class curbsideLaneChangeController(BaseLaneChangeController):
 
     def get_lane_change_action(self, env):
 
-        self.update_state(env)
-        current_state = env.k.vehicle.get_state(self.veh_id)
+        # curbside envs advance the lifecycle of all vehicles once per step
+        machine = getattr(env, "parking_states", None)
+        if machine is not None:
+            current_state = machine.advance(env).get(self.veh_id)
+        else:
+            self.update_state(env)
+            current_state = env.k.vehicle.get_state(self.veh_id)
 
         if current_state == "inflow": lc = 0
         elif current_state == "slowing": lc = -1
@@ -54,7 +62,7 @@ class curbsideLaneChangeController(BaseLaneChangeController):
 
             if t_elapsed >= t_total:
                 current_state = "outflow"
-            if v > 1e-3:
+            elif v > 1e-3:
                 current_state = "parking"
             else:
                 current_state = "parked"
@@ -65,46 +73,53 @@ class curbsideLaneChangeController(BaseLaneChangeController):
 
 
 class curbsideRouter(BaseRouter):
+    """Moves the target zone of a searching vehicle to the nearest free one.
+
+    Router params: "lookahead", number of zones ahead of the current one
+    that are searched (default LOOKAHEAD).
+    """
 
     def choose_route(self, env):
         # Not actually route chosing, just looking for parking spaces
-        pzone = env.k.vehicle.get_pzone(self.veh_id, env)
-        edge = env.k.vehicle.get_edge(self.veh_id)
 
-        Nzones = env.network.net_params.additional_params["number_parking_zones"]
-        other_vehicles = list(env.k.vehicle._TraCIVehicle__vehicles.keys())
-        other_vehicles.remove(self.veh_id)
-        Nlook = 5
+        # vectorized search shared by all curbside vehicles of a curbside env
+        fleet = getattr(env, "fleet_router", None)
+        if fleet is not None:
+            fleet.update(env)
+            return
 
-        pzone_orig = pzone
-        # if we are in the inflow or outflow, just proceed as normal
-        if edge in ["inflow", "outflow"] or ":" in edge: return
+        pzone = env.k.vehicle.get_pzone(self.veh_id, env)
+        edge = env.k.vehicle.get_edge(self.veh_id)
+        Nzones = env.network.geometry.num_zones
         # parking edge number we are on 
-        Nedge = int(edge.strip("parking_"))
+        Nedge = env.network.geometry.zone(edge)
+        # if we are in the inflow or outflow, just proceed as normal
+        if Nedge < 0: return
 
         # if we are nowhere close just proceed
-        if pzone > Nedge+5: return
+        hi = min(Nedge + self.lookahead, Nzones - 1)
+        if pzone > hi: return
 
         # if we accidentally passed our parking spot we have to update it
-        if pzone < Nedge: pzone = Nedge
-
-        # If our desired spot is not open then we look around +/-
-        if self.check_parking_occupied(env, pzone, self.veh_id):
+        target = max(pzone, Nedge)
+        for z in target + search_offsets(hi - Nedge):
+            if Nedge <= z <= hi and not self.check_parking_occupied(env, z, self.veh_id):
+                target = int(z)
+                break
 
-            for i in [-1,1,-2,2,-3,3,-4,4]:
+        if target != pzone:
+            env.k.vehicle.set_pzone(self.veh_id, target)
 
-                if pzone + i > Nedge+5: continue
-                if pzone + i < Nedge: continue
-                if pzone + i >= Nzones-1: continue
-                if pzone < 1: continue
-
-                if not self.check_parking_occupied(env, pzone+i, self.veh_id):
-                    pzone = pzone + i
-                    break
-
-        #env.k.vehicle.set_pzone(self.veh_id, pzone)
+    @property
+    def lookahead(self):
+        return self.router_params.get("lookahead", LOOKAHEAD)
 
     def check_parking_occupied(self, env, Nedge, veh_id):
+        # per-step occupancy index of the curbside envs
+        occupancy = getattr(env, "parking_occupancy", None)
+        if occupancy is not None:
+            return occupancy.update(env).occupied(Nedge, exclude=veh_id)
+
         edge = f"parking_{Nedge}"
         ids = env.k.vehicle.get_ids_by_edge(edge)
         ids = [i for i in ids if i!=veh_id]
@@ -113,19 +128,139 @@ class curbsideRouter(BaseRouter):
 
         return occupied
 
- 
+
+class curbsideFleetRouter:
+    """Target zones of all curbsideRouter vehicles, searched once per step.
+
+    Every vehicle that is not parked yet, drives on a parking edge and
+    whose target lies within its look-ahead window takes part in one
+    search over the zones held by the other vehicles at the curb (see
+    assign_free_zones).  Vehicles further downstream reach the zones first
+    and win conflicts; the new target zones are written back with set_pzone.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.time = None
+
+    def update(self, env):
+        if self.time == env.time_counter:
+            return
+        self.time = env.time_counter
+
+        k = env.k.vehicle
+        num_zones = env.network.geometry.num_zones
+        occupancy = env.parking_occupancy.update(env)
+        snap = env.snapshot.update(env)
+        machine = env.parking_states.advance(env)
+
+        ids = [i for i in snap.ids
+               if isinstance(k.get_routing_controller(i), curbsideRouter)]
+        if not ids:
+            return
+        slots = np.array([snap.slot[i] for i in ids], dtype=int)
+        states = machine.state[[machine.index[i] for i in ids]]
+        lookahead = np.array([k.get_routing_controller(i).lookahead for i in ids])
+
+        Nedge = snap.edge_zone[slots]
+        pzone = snap.pzone[slots]
+        hi = np.minimum(Nedge + lookahead, num_zones - 1)
+        searching = (states <= PARKING) & (Nedge >= 0) & (pzone <= hi)
+        if not searching.any():
+            return
+        ids = np.array(ids, dtype=object)[searching]
+
+        # zones held by the vehicles at the curb that are done searching
+        searchers = set(ids)
+        held = [z for i, z in occupancy.zone_of.items() if i not in searchers]
+        free = np.bincount(np.array(held, dtype=int), minlength=num_zones) == 0
+
+        target = np.maximum(pzone, Nedge)[searching]
+        zones = assign_free_zones(target, Nedge[searching], hi[searching], free,
+                                  -snap.x[slots[searching]])
+        zones = np.where(zones >= 0, zones, target)
+
+        for veh_id, old, new in zip(ids, pzone[searching].tolist(), zones.tolist()):
+            if new != old:
+                k.set_pzone(veh_id, new)
+
+
+class curbsideFleetAccel:
+    """Accelerations of all curbsideAccelController vehicles, computed once per step.
+
+    The first controller asking for its acceleration in a simulation step
+    triggers one vectorized evaluation of IDM, slow-down-to-pzone and the
+    parking blend over every curbside-controlled vehicle; the other
+    controllers read their value from the cache.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.time = None
+        self.accel = {}
+
+    def get(self, env, veh_id):
+        if self.time != env.time_counter or veh_id not in self.accel:
+            self.update(env)
+        return self.accel[veh_id]
+
+    def update(self, env):
+        k = env.k.vehicle
+        geometry = env.network.geometry
+        L_pz = geometry.zone_length
+
+        ids = [i for i in k.get_ids()
+               if isinstance(k.get_acc_controller(i), curbsideAccelController)]
+        ctrls = [k.get_acc_controller(i) for i in ids]
+        machine = env.parking_states.advance(env)
+
+        self.time = env.time_counter
+        self.accel = {}
+        if not ids:
+            return
+
+        states = machine.state[[machine.index[i] for i in ids]]
+        # speeds and per-lane leaders from the shared snapshot
+        snap = env.snapshot.update(env)
+        slots = np.array([snap.slot[i] for i in ids], dtype=int)
+        edges = snap.edge[slots]
+        v = snap.speed[slots]
+        has_lead = snap.leader[slots] >= 0
+        h = snap.headway[slots]
+        lead_v = v + snap.rel_speed[slots]
+
+        idm = [np.array([getattr(c, name) for c in ctrls], dtype=float)
+               for name in ["v0", "T", "a", "b", "delta", "s0"]]
+        a_idm = idm_accel(v, lead_v, h, has_lead, *idm)
+
+        # parking edge number and distance to the end of the target zone
+        Nedge = geometry.zones(edges)
+        x = np.array(k.get_position(ids), dtype=float) + L_pz*(Nedge-1)
+        pzone = np.array([k.get_pzone(i, env) for i in ids], dtype=float)
+        l = pzone*L_pz - x
+        a_park = park_accel(a_idm, v, l, 5*L_pz, *idm)
+
+        seeking = (states <= PARKING) & (Nedge >= 0)
+        a = np.where(seeking, a_park, a_idm)
+        a[states == PARKED] = 0
+
+        self.accel = dict(zip(ids, a.tolist()))
 
 
 class curbsideAccelController(IDMController):
     ##### Below this is new code #####
 
-
-   
-        #print(self.veh_id, current_state,  current_edge, pzone)
-        
-
     def get_accel(self,env):
 
+        # vectorized path shared by all curbside vehicles of a curbside env
+        fleet = getattr(env, "fleet_accel", None)
+        if fleet is not None:
+            return fleet.get(env, self.veh_id)
+
         #env.k.vehicle.choose_route(env)
         self.update_state(env)
         
@@ -141,17 +276,15 @@ class curbsideAccelController(IDMController):
         return a
 
     def park(self,env):
-        N_pz = env.network.net_params.additional_params["number_parking_zones"]
-        L_total = env.network.net_params.additional_params["length_parking"] 
-        L_pz = L_total/N_pz
+        geometry = env.network.geometry
+        L_pz = geometry.zone_length
         L_slow = 5*L_pz
 
 
         edge = env.k.vehicle.get_edge(self.veh_id)
-        if edge in ['inflow', 'outflow']: return self.drive_normal(env)
-
+        Nedge = geometry.zone(edge)
+        if Nedge < 0: return self.drive_normal(env)
 
-        Nedge = int(edge.strip("parking_"))
         x = env.k.vehicle.get_position(self.veh_id)+L_pz*(Nedge-1)
         xpzone = env.k.vehicle.get_pzone(self.veh_id, env)*L_pz
         l = xpzone - x
@@ -164,7 +297,8 @@ class curbsideAccelController(IDMController):
         #elif l < L_slow: return a_slow
         else: 
             a = (l*a_IDM+(L_slow-l)*a_slow)/L_slow
-            return a
+            # as curbside_dynamics.park_accel
+            return min(a, a_IDM)
 
             
     def drive_normal(self,env):
@@ -172,8 +306,6 @@ class curbsideAccelController(IDMController):
 
     def slow_down(self,env,h):
         v = env.k.vehicle.get_speed(self.veh_id)
-        N_pz = env.network.net_params.additional_params["number_parking_zones"]
-        L_pz = env.network.net_params.additional_params["length_parking"]
 
         lead_vel = 0
         s_star = self.s0 + max(
@@ -0,0 +1,95 @@
+"""Variable-length parking spots along one continuous curb.
+
+Instead of one binary slot per parking zone, the curb of the parking
+section is a line on which every parking vehicle gets a spot of its own
+length plus a margin.  The free part of the curb is kept as sorted,
+disjoint (start, end) gaps, which is all an interval tree would give for
+non-overlapping intervals on a line: the gaps that fit a vehicle are
+found with one array pass, a spot is cut out of its gap by splitting it,
+and a released spot is merged back with its neighbouring gaps.  Used by
+the NumPy kernel (curbside_fastsim) only.
+"""
+import numpy as np
+
+
+class CurbSpots:
+    """Free gaps and allocated spots of the curb between start and end."""
+
+    def __init__(self, start, end, margin=1.):
+        self.start = start
+        self.end = end
+        self.margin = margin
+        self.clear()
+
+    def clear(self):
+        self.gap_start = np.array([self.start], dtype=float)
+        self.gap_end = np.array([self.end], dtype=float)
+        # vehicle id -> (start, end) of its spot
+        self.spots = {}
+
+    def __len__(self):
+        return len(self.spots)
+
+    def __contains__(self, veh_id):
+        return veh_id in self.spots
+
+    @property
+    def free_length(self):
+        return float(np.sum(self.gap_end - self.gap_start))
+
+    def gaps(self):
+        return list(zip(self.gap_start.tolist(), self.gap_end.tolist()))
+
+    def find(self, length, target, lo=-np.inf, hi=np.inf):
+        """(start, end) of the free spot for a vehicle of the given length.
+
+        The spot ends as close to ``target`` as the gaps allow, with its end
+        in [lo, hi]; None if no gap in that range is long enough.
+        """
+        need = length + self.margin
+        # range of feasible spot ends in every gap
+        first = np.maximum(self.gap_start + need, lo)
+        last = np.minimum(self.gap_end, hi)
+        fits = np.flatnonzero(first <= last)
+        if len(fits) == 0:
+            return None
+        end = np.clip(target, first[fits], last[fits])
+        i = np.argmin(np.abs(end - target))
+        # max() keeps the rounding of end - need inside the gap
+        return float(max(end[i] - need, self.gap_start[fits[i]])), float(end[i])
+
+    def allocate(self, veh_id, length, target, lo=-np.inf, hi=np.inf):
+        """Reserve the spot found for veh_id, returns it or None."""
+        spot = self.find(length, target, lo, hi)
+        if spot is not None:
+            self.occupy(veh_id, *spot)
+        return spot
+
+    def occupy(self, veh_id, start, end):
+        """Take the free interval [start, end] for veh_id."""
+        i = np.searchsorted(self.gap_start, start, side="right") - 1
+        if i < 0 or end > self.gap_end[i] + 1e-9:
+            raise ValueError("Curb interval [{}, {}] is not free".format(start, end))
+        pieces = [(s, e) for s, e in [(self.gap_start[i], start), (end, self.gap_end[i])]
+                  if e - s > 1e-9]
+        self.gap_start = np.concatenate([self.gap_start[:i], [s for s, _ in pieces],
+                                         self.gap_start[i+1:]])
+        self.gap_end = np.concatenate([self.gap_end[:i], [e for _, e in pieces],
+                                       self.gap_end[i+1:]])
+        self.spots[veh_id] = (start, end)
+
+    def release(self, veh_id):
+        """Give the spot of veh_id back to the free gaps, if it has one."""
+        spot = self.spots.pop(veh_id, None)
+        if spot is None:
+            return
+        start, end = spot
+        i = np.searchsorted(self.gap_start, start)
+        # merge with the gaps ending at start and starting at end
+        lo = i - 1 if i > 0 and abs(self.gap_end[i-1] - start) < 1e-9 else i
+        hi = i + 1 if i < len(self.gap_start) and abs(self.gap_start[i] - end) < 1e-9 else i
+        merged_start = self.gap_start[lo] if lo < i else start
+        merged_end = self.gap_end[hi-1] if hi > i else end
+        self.gap_start = np.concatenate([self.gap_start[:lo], [merged_start],
+                                         self.gap_start[hi:]])
+        self.gap_end = np.concatenate([self.gap_end[:lo], [merged_end], self.gap_end[hi:]])
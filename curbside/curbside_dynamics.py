@@ -0,0 +1,48 @@
+"""Vectorized car-following and parking accelerations.
+
+Array versions of the IDM and parking rules of curbsideAccelController and
+of the per-lane leader search, shared by the vehicle snapshot, the
+fleet-level controller path and the NumPy simulation backend.
+All arguments broadcast, so IDM parameters may be scalars or per-vehicle
+arrays.
+"""
+import numpy as np
+
+
+def idm_accel(v, lead_v, h, has_lead, v0, T, a, b, delta, s0):
+    """IDM acceleration, as in flow's IDMController.get_accel."""
+    # in order to deal with ZeroDivisionError
+    h = np.where(np.abs(h) < 1e-3, 1e-3, h)
+    s_star = np.where(has_lead, s0 + np.maximum(
+        0, v * T + v * (v - lead_v) / (2 * np.sqrt(a * b))), 0)
+    return a * (1 - (v / v0)**delta - (s_star / h)**2)
+
+
+def park_accel(a_idm, v, l, L_slow, v0, T, a, b, delta, s0):
+    """Blend of IDM and slowing down towards a standing target l metres ahead.
+
+    Far from the target (l > L_slow) this is the IDM acceleration, closer to
+    it the weight moves linearly to the slow-down acceleration.  Never above
+    a_idm, so a parking vehicle does not close in on its leader faster than
+    car following allows.
+    """
+    a_slow = idm_accel(v, 0, l, True, v0, T, a, b, delta, s0)
+    blend = np.where(l > L_slow, a_idm, (l*a_idm + (L_slow-l)*a_slow) / L_slow)
+    return np.minimum(blend, a_idm)
+
+
+def lane_neighbors(x, lane):
+    """Leader and follower index of every vehicle in its lane, -1 if none.
+
+    One sort by (lane, position); the leader is the next vehicle ahead in
+    the same lane.
+    """
+    n = len(x)
+    leader = np.full(n, -1)
+    follower = np.full(n, -1)
+    order = np.lexsort((x, lane))
+    same_lane = lane[order[1:]] == lane[order[:-1]]
+    back, front = order[:-1][same_lane], order[1:][same_lane]
+    leader[back] = front
+    follower[front] = back
+    return leader, follower
@@ -4,6 +4,19 @@ from gym.spaces.box import Box
 
 import numpy as np
 import collections
+import os
+import random
+from copy import deepcopy
+
+from curbside_controllers import curbsideFleetAccel, curbsideFleetRouter, \
+	curbsideAccelController, curbsideLaneChangeController, curbsideRouter
+from curbside_inflow import InflowInjector
+from curbside_observation import FEATURES, ObservationEncoder
+from curbside_occupancy import ParkingOccupancy
+from curbside_profiling import StepProfiler, instrument_controllers
+from curbside_replay import EpisodeLog, ReplayCache, derive_seed
+from curbside_snapshot import VehicleSnapshot
+from curbside_state import ParkingStateMachine, state_translation
 
 ADDITIONAL_ENV_PARAMS = {
     # maximum acceleration for autonomous vehicles, in m/s^2
@@ -12,10 +25,32 @@ ADDITIONAL_ENV_PARAMS = {
     "max_decel": 3,
     # maximum number of controllable vehicles in the network
     "num_rl": 5,
+    # optional: validity flag per RL vehicle row ("obs_mask"), number of
+    # nearest neighbours ("obs_neighbors") within "obs_radius" metres,
+    # directory of the episode records of seeded envs ("replay_cache")
 }
-state_translation = {"inflow":0,"slowing":1,"parking":2,"parked":3, "outflow":4}
+
+
+# SUMO options that only apply to a new process, dropped on a reload
+PROCESS_OPTIONS = ["--remote-port", "--num-clients"]
+
+
+def load_args(sumo_call, seed):
+	"""Arguments of traci.load from the command line SUMO was started with."""
+	args = []
+	# flow passes every option with a value
+	for opt, value in zip(sumo_call[1::2], sumo_call[2::2]):
+		if opt in PROCESS_OPTIONS:
+			continue
+		args += [opt, str(seed) if opt == "--seed" else value]
+	if "--seed" not in args:
+		args += ["--seed", str(seed)]
+	return args
+
 
 class CurbsideEnv(Env):
+	# observed features of every RL vehicle, see curbside_observation
+	OBS_FEATURES = FEATURES
 
 	def __init__(self, env_params, sim_params, network, simulator='traci'):
 	    for p in ADDITIONAL_ENV_PARAMS.keys():
@@ -25,7 +60,154 @@ class CurbsideEnv(Env):
 
 	    # maximum number of controlled vehicles
 	    self.num_rl = env_params.additional_params["num_rl"]
-	    super().__init__(env_params, sim_params, network, simulator)
+	    # per-step vehicle fields shared by get_state and compute_reward
+	    self.snapshot = VehicleSnapshot()
+	    # preallocated observation rows of the RL vehicles
+	    self.encoder = ObservationEncoder.from_params(
+	        self.OBS_FEATURES, env_params.additional_params)
+	    # accelerations of all curbside controlled vehicles, once per step
+	    self.fleet_accel = curbsideFleetAccel()
+	    # curb occupancy of the parking zones, queried by curbsideRouter
+	    self.parking_occupancy = ParkingOccupancy(network.geometry.num_zones)
+	    # target zone search of all curbside routed vehicles, once per step
+	    self.fleet_router = curbsideFleetRouter()
+	    # lifecycle state of every vehicle, advanced once per step
+	    self.parking_states = ParkingStateMachine(sim_params.sim_step)
+	    # simulation steps reflected in the kernel state, see additional_command
+	    self.sim_time = 0
+	    self.profiler = None
+
+	    # per-episode seeds (see seed_episodes) and the episode records
+	    self.seed_keys = None
+	    self.episode = 0
+	    self.replay_seed = None
+	    self.episode_log = None
+	    replay_cache = env_params.additional_params.get("replay_cache")
+	    self.replay_cache = ReplayCache(replay_cache) if replay_cache else None
+
+	    # scheduled arrivals, see curbside_inflow
+	    inflow = network.net_params.additional_params.get("inflow")
+	    self.inflow = InflowInjector(inflow, network.geometry.num_zones) if inflow else None
+
+	    # keep one SUMO process and reload it on reset instead of relaunching
+	    self.warm_reset = env_params.additional_params.get("warm_reset", False)
+	    if self.warm_reset:
+	        sim_params.restart_instance = False
+
+	    # hand the generated network to the other workers, the lock taken by
+	    # the network is released even if the kernel fails to generate it
+	    try:
+	        super().__init__(env_params, sim_params, network, simulator)
+	        if getattr(network, "net_cache", None) is not None:
+	            network.store_net_cache(
+	                os.path.join(self.k.network.net_path, self.k.network.netfn))
+	    finally:
+	        if getattr(network, "net_cache", None) is not None:
+	            network.release_net_cache()
+
+	    # opt-in timers and call counters around the step hot path
+	    if env_params.additional_params.get("profile", False):
+	        self.profiler = StepProfiler()
+	        self.profiler.instrument_env(self)
+	        instrument_controllers(curbsideAccelController,
+	                               curbsideLaneChangeController, curbsideRouter)
+
+	def reset(self):
+		"""See class definition."""
+		self.snapshot.clear()
+		self.fleet_accel.clear()
+		self.parking_occupancy.clear()
+		self.fleet_router.clear()
+		self.parking_states.clear()
+		if self.profiler is not None:
+			self.profiler.end_rollout()
+		self.sim_time = 0
+
+		if self.episode_log is not None and self.replay_cache is not None \
+				and self.episode_log.num_steps > 0:
+			self.replay_cache.store(self.episode_log)
+		self.episode_log = None
+		seed = self.next_episode_seed()
+		if seed is not None:
+			# flow draws the SUMO seed of a restarted simulation from random,
+			# the kernel draws parking zones and times from random/np.random
+			random.seed(seed)
+			np.random.seed(seed)
+
+		if self.inflow is not None:
+			# drawn after seeding, so that seeded episodes get the same arrivals
+			duration = self.env_params.horizon * self.env_params.sims_per_step * self.sim_step
+			self.inflow.reset(duration, np.random.default_rng(np.random.randint(2**31 - 1)))
+
+		# seeded episodes reload SUMO with their own seed from the first one on
+		if self.warm_reset and (self.step_counter > 0 or seed is not None):
+			self.warm_restart()
+		obs = super().reset()
+		if self.profiler is not None:
+			# restarts and warm restarts bring a fresh vehicle kernel
+			self.profiler.instrument_vehicle(self.k.vehicle)
+
+		if seed is not None:
+			self.episode_log = EpisodeLog(seed)
+			self.episode_log.record_inflow(self)
+		return obs
+
+	def seed_episodes(self, base, *keys):
+		"""Seed episode e with derive_seed(base, *keys, e) from now on."""
+		self.seed_keys = (base, ) + keys
+		self.episode = 0
+
+	def next_episode_seed(self):
+		"""Seed of the episode being reset, None if the env is not seeded."""
+		if self.replay_seed is not None:
+			return self.replay_seed
+		if self.seed_keys is None:
+			return None
+		seed = derive_seed(*self.seed_keys, self.episode)
+		self.episode += 1
+		return seed
+
+	def step(self, rl_actions):
+		"""See parent class."""
+		if self.inflow is not None:
+			self.inflow.apply_pending(self)
+		if self.episode_log is None:
+			return super().step(rl_actions)
+		self.episode_log.record_action(rl_actions)
+		result = super().step(rl_actions)
+		self.episode_log.record_inflow(self)
+		return result
+
+	def additional_command(self):
+		"""See parent class.
+
+		Runs right before the simulation step, after the controllers of the
+		step have read the kernel state.
+		"""
+		self.sim_time = self.time_counter
+		if self.inflow is not None:
+			self.inflow.inject(self, self.time_counter * self.sim_step)
+
+	def warm_restart(self):
+		"""Reload the initial config into the running SUMO process.
+
+		Mirrors a full restart (fresh seed, fresh vehicle kernel, same
+		network) but keeps the process and the TraCI connection, so the
+		parent reset only has to re-insert the initial vehicles.
+		"""
+		# issue a random seed to induce randomness into the next rollout
+		self.sim_params.seed = random.randint(0, 1e5)
+
+		self.k.vehicle = deepcopy(self.initial_vehicles)
+		self.k.vehicle.master_kernel = self.k
+
+		# the command line flow started SUMO with, without the options tied
+		# to the process (binary, remote port, number of clients)
+		sumo_args = load_args(self.k.simulation.sumo_proc.args, self.sim_params.seed)
+		self.k.kernel_api.load(sumo_args)
+
+		# subscriptions do not survive a load
+		self.k.pass_api(self.k.kernel_api)
 
 	@property
 	def action_space(self):
@@ -36,6 +218,15 @@ class CurbsideEnv(Env):
 	        shape=(self.num_rl, ),
 	        dtype=np.float32)
 
+	@property
+	def observation_space(self):
+	    """See class definition."""
+	    return Box(low=-1, high=1, shape=(self.encoder.size, ), dtype=np.float32)
+
+	def get_state(self, rl_id=None, **kwargs):
+		"""See class definition."""
+		return self.encoder.encode(self)
+
 	def _apply_rl_actions(self, rl_actions):
 		"""See class definition."""
 		for i,rl_id in enumerate(self.k.vehicle.get_rl_ids()):
@@ -46,48 +237,8 @@ class CurbsideEnv(Env):
 
 
 class CurbsideSoloEnv(CurbsideEnv):
-	@property
-	def observation_space(self):
-	    """See class definition."""
-	    return Box(low=-1, high=1, shape=(4 * self.num_rl, ), dtype=np.float32)
-	
-	def get_state(self, rl_id=None, **kwargs):
-		max_speed = self.k.network.max_speed()*3
-		max_length = self.k.network.length()
-		L_p = self.network.net_params.additional_params["length_parking"] 
-		L_i = self.network.net_params.additional_params["length_inflow"] 
-		L_o = self.network.net_params.additional_params["length_outflow"] 
-		N_p = self.network.net_params.additional_params["number_parking_zones"]
-		L = L_p + L_i + L_o
-
-		observation = [0 for _ in range(4 * self.num_rl)]
-
-		for i, rl_id in enumerate(self.k.vehicle.get_rl_ids()):
-
-			# OBSERVATION 1
-			# get distance to parking spot normalized by length of parking area
-
-			l = self.k.vehicle.get_distance_to_pzone(rl_id, self)
-			N = self.k.vehicle.get_pzone(rl_id, self)
-			x = self.k.vehicle.get_global_position(rl_id, self) 
-
-			# OBSERVATION 2
-			# get current status (0 = not yet parked, 1=parking completed)
-			state = state_translation[self.k.vehicle.get_state(rl_id)]
-			state = state in [3,4]
-
-			# OBSERVATION 3
-			# get current speed normalized by max speed
-			this_speed = self.k.vehicle.get_speed(rl_id)
-
-			observation[5 * i + 0] = x / L
-			observation[5 * i + 1] = l / L
-			observation[5 * i + 2] = N / N_p
-			observation[5 * i + 3] = (this_speed) / max_speed
-			observation[5 * i + 4] = state / 4 # number of states
-
-
-		return observation
+	# position, distance to and index of the parking zone, speed, parked
+	OBS_FEATURES = FEATURES[:5]
 
 	def compute_reward(self, rl_actions, **kwargs):
 		"""See class definition."""
@@ -125,90 +276,25 @@ class CurbsideSoloEnv(CurbsideEnv):
 
 
 class CurbsideTrafficEnv(CurbsideEnv):
-	@property
-	def observation_space(self):
-	    """See class definition."""
-	    return Box(low=-1, high=1, shape=(4 * self.num_rl, ), dtype=np.float32)
-	
-	def get_state(self, rl_id=None, **kwargs):
-		max_speed = self.k.network.max_speed()*3
-		max_length = self.k.network.length()
-		L_p = self.network.net_params.additional_params["length_parking"] 
-		L_i = self.network.net_params.additional_params["length_inflow"] 
-		L_o = self.network.net_params.additional_params["length_outflow"] 
-		N_p = self.network.net_params.additional_params["number_parking_zones"]
-		L = L_p + L_i + L_o
-
-		N_obvs = 7
-
-		observation = [0 for _ in range(N_obvs * self.num_rl)]
-
-		for i, rl_id in enumerate(self.k.vehicle.get_rl_ids()):
-
-			# OBSERVATION 1
-			# get distance to parking spot normalized by length of parking area
-
-			l = self.k.vehicle.get_distance_to_pzone(rl_id, self)
-			N = self.k.vehicle.get_pzone(rl_id, self)
-			x = self.k.vehicle.get_global_position(rl_id, self) 
-
-			# OBSERVATION 2
-			# get current status (0 = not yet parked, 1=parking completed)
-			state = state_translation[self.k.vehicle.get_state(rl_id)]
-			state = state in [3,4]
-
-			# OBSERVATION 3
-			# get current speed normalized by max speed
-			this_speed = self.k.vehicle.get_speed(rl_id)
-
-			lead_id = self.k.vehicle.get_leader(rl_id)
-			if lead_id in ["", None]:
-                # in case leader is not visible
-                lead_speed = max_speed
-                lead_head = max_length
-            else:
-				lead_speed = self.k.vehicle.get_speed(lead_id)
-				lead_head = self.k.vehicle.get_x_by_id(lead_id) \
-							- self.k.vehicle.get_x_by_id(rl_id) \
-							- self.k.vehicle.get_length(rl_id)
-
-			observation[N_obvs * i + 0] = x / L
-			observation[N_obvs * i + 1] = l / L
-			observation[N_obvs * i + 2] = N / N_p
-			observation[N_obvs * i + 3] = (this_speed) / max_speed
-			observation[N_obvs * i + 4] = state / 4 # number of states
-			observation[N_obvs * i + 5] = lead_speed / max_speed
-			observation[N_obvs * i + 6] = lead_head / max_length
-
-		return observation
+	# the solo features and the speed of and headway to the leader
+	OBS_FEATURES = FEATURES
 
 	def compute_reward(self, rl_actions, **kwargs):
 		"""See class definition."""
-		L_p = self.network.net_params.additional_params["length_parking"] 
-
 		if rl_actions is None:
 			return 0
 		
 		if kwargs["fail"]:
 			return -10
 
-		reward = 0
-		cost = 0
-
-		for rl_id in self.k.vehicle.get_rl_ids():
-
-			edge = self.k.vehicle.get_edge(rl_id)
-			pzone = self.k.vehicle.get_pzone(rl_id,self)
-			state = self.k.vehicle.get_state(rl_id)
-
-			if state in ['parked', "outflow"]:
-				reward += self.k.vehicle.get_speed(rl_id)				
-			else:
-				if edge == f"parking_{pzone}": 
-					reward += 1
+		snap = self.snapshot.update(self)
+		rl = snap.rl_slots
 
-			cost += 1
+		done = snap.state[rl] >= state_translation["parked"]
+		on_spot = snap.edge_zone[rl] == snap.pzone[rl]
 
+		reward = snap.speed[rl][done].sum() + np.count_nonzero(on_spot & ~done)
+		cost = len(rl)
 
 		# weights for cost1, cost2, and cost3, respectively
 		eta_cost, eta_reward = 1e-4, 1e-2
@@ -0,0 +1,677 @@
+"""SUMO-free NumPy simulation backend for the curbside corridor.
+
+The corridor built by curbsideNetworkPZones is a straight road
+inflow -> parking_0 .. parking_{N-1} -> outflow.  Parking edges have a curb
+lane (lane 0) next to the travel lane, the inflow and outflow edges only have
+the travel lane.  The kernel below keeps every vehicle in flat NumPy arrays,
+advances the inflow/parking/parked/outflow lifecycle, lane choice and IDM car
+following for all vehicles at once, and exposes the vehicle kernel methods
+used by the curbside controllers and envs.  The SUMO path remains the
+validation backend.
+
+With the net param ``curb_spots`` the curb of the parking section is one
+continuous line instead of one slot per zone: every parking vehicle gets a
+spot of its own length from a CurbSpots gap index, and parks at the end of
+it.  The target zone is then the zone the spot ends in.  Curb spots only
+exist in this kernel; the SUMO network keeps one slot per zone and rejects
+the parameter.
+"""
+import functools
+import types
+
+import numpy as np
+
+from curbside_dynamics import idm_accel, lane_neighbors, park_accel
+from curbside_profiling import StepProfiler
+from curbside_curb import CurbSpots
+from curbside_geometry import CorridorGeometry
+from curbside_inflow import InflowInjector
+from curbside_occupancy import LOOKAHEAD, assign_free_zones
+from curbside_observation import ObservationEncoder
+from curbside_replay import derive_seed
+from curbside_snapshot import VehicleSnapshot
+from curbside_state import STATE_NAMES, state_translation, advance_states
+
+FAST_SIM_PARAMS = {
+    # IDM parameters (flow IDMController defaults)
+    "v0": 30,
+    "T": 1,
+    "a": 1,
+    "b": 1.5,
+    "delta": 4,
+    "s0": 2,
+    # range of the total parking time drawn for each vehicle, in s
+    "tpark_min": 60,
+    "tpark_max": 600,
+    # vehicle length, in m
+    "length": 5,
+    # zones ahead of the current one searched for a free curb spot
+    "lookahead": LOOKAHEAD,
+    # space left behind a parked vehicle with curb_spots, in m
+    "spot_margin": 1.,
+}
+
+
+class FastNetworkKernel:
+    """Network kernel of the linear curbside corridor."""
+
+    def __init__(self, net_params):
+        p = net_params.additional_params
+        self.geometry = CorridorGeometry(p)
+        self.lanes = p["lanes"]
+        self.speed_limit = p["speed_limit"]
+
+        self.L_i = p["length_inflow"]
+        self.L_p = p["length_parking"]
+        self.N_p = self.geometry.num_zones
+        self.L_pz = self.geometry.zone_length
+        # variable-length spots on one continuous curb instead of zone slots
+        self.curb_spots = p.get("curb_spots", False)
+        self.edges = self.geometry.edges
+        self.edge_starts = self.geometry.edge_starts
+        self.edge_index = self.geometry.edge_index
+
+    def max_speed(self):
+        return self.speed_limit
+
+    def length(self):
+        return self.geometry.length
+
+    def get_edge_list(self):
+        return list(self.edges)
+
+    def edge_length(self, edge):
+        i = self.edge_index[edge]
+        end = self.length() if i == len(self.edges) - 1 else self.edge_starts[i+1]
+        return end - self.edge_starts[i]
+
+    def num_lanes(self, edge):
+        return self.lanes if edge.startswith("parking_") else self.lanes - 1
+
+    def edge_of(self, x):
+        """Index into self.edges for an array of global positions."""
+        return self.geometry.edge_at(x)
+
+
+class FastVehicleKernel:
+    """Vehicle arrays and the vehicle kernel methods used by the curbside code.
+
+    Per-vehicle arrays share one slot index; ``index`` maps vehicle ids to
+    slots.  Slots are compacted whenever vehicles leave the corridor.
+    """
+
+    def __init__(self, network, sim_step, params=None):
+        self.network = network
+        self.sim_step = sim_step
+        self.params = dict(FAST_SIM_PARAMS, **(params or {}))
+        self.time = 0
+        self.spots = None
+        if network.curb_spots:
+            self.spots = CurbSpots(network.L_i, network.L_i + network.L_p,
+                                   self.params["spot_margin"])
+        self._clear()
+
+    def _clear(self):
+        self.ids = []
+        self.index = {}
+        self.types = []
+        self.is_rl = np.zeros(0, dtype=bool)
+        self.x = np.zeros(0)
+        self.v = np.zeros(0)
+        self.length = np.zeros(0)
+        self.curb = np.zeros(0, dtype=bool)
+        self.pzone = np.zeros(0, dtype=int)
+        # allocated curb spot, nan without one (curb_spots only)
+        self.spot_start = np.zeros(0)
+        self.spot_end = np.zeros(0)
+        self.state = np.zeros(0, dtype=np.int8)
+        self.t_elapsed = np.zeros(0)
+        self.t_total = np.zeros(0)
+        self.accel = np.zeros(0)
+        self.leader = np.zeros(0, dtype=int)
+        self.headway = np.zeros(0)
+        self.lead_v = np.zeros(0)
+        self.edge = np.zeros(0, dtype=int)
+        self.departures = []
+        self.arrivals = []
+        if self.spots is not None:
+            self.spots.clear()
+
+    # ----- population -----
+
+    def reset(self):
+        self.time = 0
+        self._clear()
+
+    def add(self, veh_ids, veh_type, x, v, pzone, t_total, rl=False):
+        """Insert vehicles at global positions x with initial speeds v."""
+        n = len(veh_ids)
+        start = len(self.ids)
+        self.ids += list(veh_ids)
+        self.index.update({veh_id: start+i for i, veh_id in enumerate(veh_ids)})
+        self.types += [veh_type] * n
+        self.is_rl = np.append(self.is_rl, np.full(n, rl))
+        self.x = np.append(self.x, x)
+        self.v = np.append(self.v, v)
+        self.length = np.append(self.length, np.full(n, float(self.params["length"])))
+        self.curb = np.append(self.curb, np.zeros(n, dtype=bool))
+        self.pzone = np.append(self.pzone, pzone).astype(int)
+        self.spot_start = np.append(self.spot_start, np.full(n, np.nan))
+        self.spot_end = np.append(self.spot_end, np.full(n, np.nan))
+        self.state = np.append(self.state, np.zeros(n, dtype=np.int8))
+        self.t_elapsed = np.append(self.t_elapsed, np.zeros(n))
+        self.t_total = np.append(self.t_total, t_total)
+        self.accel = np.append(self.accel, np.full(n, np.nan))
+        self.leader = np.append(self.leader, np.full(n, -1))
+        self._update_leaders()
+        self.departures += [self.time] * n
+
+    def remove(self, mask):
+        """Drop the vehicles selected by the boolean mask."""
+        keep = ~mask
+        self._release_spots(mask)
+        self.ids = [veh_id for veh_id, k in zip(self.ids, keep) if k]
+        self.types = [t for t, k in zip(self.types, keep) if k]
+        self.index = {veh_id: i for i, veh_id in enumerate(self.ids)}
+        for name in ["is_rl", "x", "v", "length", "curb", "pzone", "spot_start", "spot_end",
+                     "state",
+                     "t_elapsed", "t_total", "accel", "edge"]:
+            setattr(self, name, getattr(self, name)[keep])
+        self.arrivals += [self.time] * int(mask.sum())
+        self._update_leaders()
+
+    @property
+    def num_vehicles(self):
+        return len(self.ids)
+
+    # ----- per-step dynamics -----
+
+    def _lane_key(self):
+        # 0 for the curb lane, 1 for the travel lane
+        return (~self.curb).astype(int)
+
+    def _update_leaders(self):
+        """Leader slot and bumper-to-bumper headway for every vehicle, per lane."""
+        n = self.num_vehicles
+        self.leader = np.full(n, -1)
+        self.headway = np.full(n, np.inf)
+        self.lead_v = self.v.copy()
+        self.edge = self.network.edge_of(self.x)
+        if n == 0:
+            return
+
+        self.leader, _ = lane_neighbors(self.x, self._lane_key())
+        follower = np.flatnonzero(self.leader >= 0)
+        leader = self.leader[follower]
+        self.headway[follower] = self.x[leader] - self.length[leader] - self.x[follower]
+        self.lead_v[follower] = self.v[leader]
+
+        # the curb lane ends with the parking section, seen as a standing obstacle
+        end = self.network.L_i + self.network.L_p
+        blocked = self.curb & (end - self.x < self.headway)
+        self.headway[blocked] = end - self.x[blocked]
+        self.lead_v[blocked] = 0
+
+    def _lane_gaps(self, target_curb):
+        """Free space ahead of and behind each vehicle in the given lane."""
+        other = self.curb == target_curb
+        xs = np.sort(self.x[other])
+        ls = self.length[other][np.argsort(self.x[other])]
+        pos = np.searchsorted(xs, self.x)
+        ahead = np.full(self.num_vehicles, np.inf)
+        behind = np.full(self.num_vehicles, np.inf)
+        has_ahead = pos < len(xs)
+        has_behind = pos > 0
+        ahead[has_ahead] = xs[pos[has_ahead]] - ls[pos[has_ahead]] - self.x[has_ahead]
+        behind[has_behind] = self.x[has_behind] - self.length[has_behind] - xs[pos[has_behind]-1]
+        return ahead, behind
+
+    def _route(self):
+        """curbsideRouter: move the targets of searching vehicles to free zones."""
+        if self.spots is not None:
+            return self._route_spots()
+
+        N_p = self.network.N_p
+        zone = self.edge - 1
+        hi = np.minimum(zone + self.params["lookahead"], N_p - 1)
+        on_parking = (zone >= 0) & (zone < N_p)
+        searching = (self.state <= state_translation["parking"]) & on_parking \
+            & (self.pzone <= hi)
+        if not searching.any():
+            return
+
+        # zones held by the vehicles at the curb that are done searching
+        free = np.bincount(zone[self.curb & on_parking & ~searching], minlength=N_p) == 0
+        target = np.maximum(self.pzone, zone)[searching]
+        zones = assign_free_zones(target, zone[searching], hi[searching], free,
+                                  -self.x[searching])
+        self.pzone[searching] = np.where(zones >= 0, zones, target)
+
+    def _release_spots(self, mask):
+        if self.spots is None:
+            return
+        for i in np.flatnonzero(mask & ~np.isnan(self.spot_end)):
+            self.spots.release(self.ids[i])
+        self.spot_start[mask] = np.nan
+        self.spot_end[mask] = np.nan
+
+    def _route_spots(self):
+        """curbsideRouter with curb_spots: reserve a spot for every searching vehicle.
+
+        A vehicle searches once the end of its target zone is within its
+        look-ahead and takes the spot ending closest to it among those it
+        can still stop at.  Vehicles further downstream pick first.
+        """
+        net = self.network
+        p = self.params
+        seeking = self.state <= state_translation["parking"]
+        # a vehicle that drove past its spot gives it up and searches again
+        passed = self.x > self.spot_end + self.spots.margin/2
+        self._release_spots(seeking & ~self.curb & passed)
+
+        reach = self.x + p["lookahead"]*net.L_pz
+        target = net.L_i + (self.pzone + 1)*net.L_pz
+        searching = seeking & np.isnan(self.spot_end) & (target <= reach) \
+            & (reach >= net.L_i)
+        if not searching.any():
+            return
+
+        stop = self.x + self.v**2/(2*p["b"])
+        for i in sorted(np.flatnonzero(searching), key=lambda i: -self.x[i]):
+            spot = self.spots.allocate(self.ids[i], self.length[i], target[i],
+                                       lo=stop[i], hi=reach[i])
+            if spot is not None:
+                self.spot_start[i], self.spot_end[i] = spot
+        self.pzone[searching] = np.where(
+            np.isnan(self.spot_end[searching]), self.pzone[searching],
+            net.geometry.zone_at(np.nan_to_num(self.spot_end[searching]) - 1e-6))
+
+    def _advance_states(self):
+        """One transition of the inflow/parking/parked/outflow lifecycle."""
+        if self.spots is not None:
+            return self._advance_spot_states()
+
+        zone = self.edge - 1
+        on_parking = (zone >= 0) & (zone < self.network.N_p)
+        # targets behind a vehicle were already moved up by _route, as
+        # curbsideRouter does on the SUMO side
+        self.state = advance_states(self.state, np.where(on_parking, zone, -1),
+                                    self.pzone, self.v, self.t_elapsed,
+                                    self.t_total, self.sim_step)
+
+    def _advance_spot_states(self):
+        # the lifecycle of advance_states with the spot as the target: parking
+        # starts one zone length before the spot ends, the vehicle is parked
+        # once it stands at the curb within its spot
+        has_spot = ~np.isnan(self.spot_end)
+        approach = has_spot & (self.spot_end - self.x <= self.network.L_pz)
+        inside = has_spot & self.curb & self._alongside_spot()
+        self.state = advance_states(self.state, np.where(inside, 1, np.where(approach, 0, -1)),
+                                    np.ones(self.num_vehicles, dtype=int), self.v,
+                                    self.t_elapsed, self.t_total, self.sim_step)
+        # leaving vehicles free their spot once back in traffic
+        self._release_spots((self.state == state_translation["outflow"]) & ~self.curb)
+
+    def _alongside_spot(self):
+        # whole vehicle next to its spot, up to half the margin
+        return self.x - self.length >= self.spot_start - self.spots.margin/2
+
+    def _change_lanes(self):
+        """Move parking vehicles to the curb and leaving vehicles back to traffic."""
+        st = state_translation
+        zone = self.edge - 1
+        on_parking = (zone >= 0) & (zone < self.network.N_p)
+        s0 = self.params["s0"]
+
+        to_curb = on_parking & ~self.curb & (self.state == st["parking"])
+        ahead, behind = self._lane_gaps(True)
+        if self.spots is not None:
+            # pull in once the whole vehicle is alongside its spot, which is
+            # reserved for it, so only overlaps with the neighbours count
+            to_curb &= self._alongside_spot()
+            self.curb[to_curb & (ahead >= 0) & (behind >= 0)] = True
+        else:
+            self.curb[to_curb & (ahead >= s0) & (behind >= s0)] = True
+
+        to_travel = self.curb & (self.state == st["outflow"])
+        ahead, behind = self._lane_gaps(False)
+        self.curb[to_travel & (ahead >= s0) & (behind >= s0)] = False
+
+    def _accelerations(self):
+        """curbsideAccelController behaviour for all vehicles without an RL command."""
+        p = self.params
+        st = state_translation
+        net = self.network
+
+        idm = (p["v0"], p["T"], p["a"], p["b"], p["delta"], p["s0"])
+        a_idm = idm_accel(self.v, self.lead_v, self.headway,
+                          np.isfinite(self.headway), *idm)
+
+        # distance to the end of the target zone
+        l = (self.pzone + 1)*net.L_pz - (self.x - net.L_i)
+        a_park = park_accel(a_idm, self.v, l, 5*net.L_pz, *idm)
+
+        seeking = (self.state <= st["parking"]) & (self.edge > 0) & (self.edge <= net.N_p)
+        if self.spots is not None:
+            # stop half the margin before the end of the spot (park_accel
+            # keeps s0 to l), vehicles without one keep driving
+            has_spot = ~np.isnan(self.spot_end)
+            l = np.where(has_spot, self.spot_end - self.spots.margin/2 + p["s0"] - self.x, l)
+            a_park = park_accel(a_idm, self.v, l, 5*net.L_pz, *idm)
+            seeking = (self.state <= st["parking"]) & has_spot
+        a = np.where(seeking, a_park, a_idm)
+        a[self.state == st["parked"]] = 0
+
+        rl_cmd = self.is_rl & ~np.isnan(self.accel)
+        a[rl_cmd] = self.accel[rl_cmd]
+        return a
+
+    def step(self):
+        """Advance the corridor by one simulation step."""
+        dt = self.sim_step
+        self.time += dt
+        if self.num_vehicles == 0:
+            return
+
+        self._update_leaders()
+        self._route()
+        self._advance_states()
+        self._change_lanes()
+        self._update_leaders()
+
+        a = self._accelerations()
+        # obey safe speed: never drive into the leader within one step
+        v_safe = np.maximum(self.headway, 0) / dt
+        v = np.clip(self.v + a*dt, 0, np.minimum(self.network.speed_limit, v_safe))
+        v[self.state == state_translation["parked"]] = 0
+        self.v = v
+        self.x = self.x + v*dt
+        self.accel[:] = np.nan
+
+        self.remove(self.x >= self.network.length())
+
+    # ----- kernel accessors -----
+
+    def _get(self, veh_id, arr, default=None):
+        if isinstance(veh_id, (list, tuple, np.ndarray)):
+            return [self._get(i, arr, default) for i in veh_id]
+        i = self.index.get(veh_id)
+        if i is None:
+            return default
+        return arr[i].item() if isinstance(arr, np.ndarray) else arr[i]
+
+    def get_ids(self):
+        return list(self.ids)
+
+    def get_rl_ids(self):
+        return [veh_id for veh_id, rl in zip(self.ids, self.is_rl) if rl]
+
+    def get_human_ids(self):
+        return [veh_id for veh_id, rl in zip(self.ids, self.is_rl) if not rl]
+
+    def get_type(self, veh_id):
+        return self._get(veh_id, self.types)
+
+    def get_speed(self, veh_id, error=-1001):
+        return self._get(veh_id, self.v, error)
+
+    def get_length(self, veh_id, error=-1001):
+        return self._get(veh_id, self.length, error)
+
+    def get_x_by_id(self, veh_id):
+        return self._get(veh_id, self.x, 0.)
+
+    def get_global_position(self, veh_id, env=None):
+        return self._get(veh_id, self.x, 0.)
+
+    def get_edge(self, veh_id, error=""):
+        if isinstance(veh_id, (list, tuple, np.ndarray)):
+            return [self.get_edge(i, error) for i in veh_id]
+        i = self.index.get(veh_id)
+        return error if i is None else self.network.edges[self.edge[i]]
+
+    def get_position(self, veh_id, error=-1001):
+        if isinstance(veh_id, (list, tuple, np.ndarray)):
+            return [self.get_position(i, error) for i in veh_id]
+        i = self.index.get(veh_id)
+        return error if i is None else self.x[i] - self.network.edge_starts[self.edge[i]]
+
+    def get_lane(self, veh_id, error=-1001):
+        if isinstance(veh_id, (list, tuple, np.ndarray)):
+            return [self.get_lane(i, error) for i in veh_id]
+        i = self.index.get(veh_id)
+        if i is None:
+            return error
+        on_parking = 0 < self.edge[i] <= self.network.N_p
+        return int(on_parking and not self.curb[i])
+
+    def get_leader(self, veh_id, error=""):
+        if isinstance(veh_id, (list, tuple, np.ndarray)):
+            return [self.get_leader(i, error) for i in veh_id]
+        i = self.index.get(veh_id)
+        if i is None or self.leader[i] < 0:
+            return error
+        return self.ids[self.leader[i]]
+
+    def get_follower(self, veh_id, error=""):
+        i = self.index.get(veh_id)
+        followers = np.flatnonzero(self.leader == i) if i is not None else []
+        return self.ids[followers[0]] if len(followers) else error
+
+    def get_headway(self, veh_id, error=-1001):
+        return self._get(veh_id, self.headway, error)
+
+    def get_ids_by_edge(self, edges):
+        if isinstance(edges, (list, tuple)):
+            return sum([self.get_ids_by_edge(e) for e in edges], [])
+        e = self.network.edge_index.get(edges)
+        return [self.ids[i] for i in np.flatnonzero(self.edge == e)]
+
+    def get_state(self, veh_id):
+        code = self._get(veh_id, self.state)
+        return None if code is None else STATE_NAMES[code]
+
+    def set_state(self, veh_id, state):
+        self.state[self.index[veh_id]] = state_translation[state]
+
+    def get_pzone(self, veh_id, env=None):
+        return self._get(veh_id, self.pzone)
+
+    def set_pzone(self, veh_id, pzone):
+        self.pzone[self.index[veh_id]] = pzone
+
+    def get_distance_to_pzone(self, veh_id, env=None):
+        i = self.index[veh_id]
+        if not np.isnan(self.spot_end[i]):
+            return self.spot_end[i] - self.x[i]
+        return self.network.L_i + self.pzone[i]*self.network.L_pz - self.x[i]
+
+    def get_tparking_elapsed(self, veh_id, env=None):
+        return self._get(veh_id, self.t_elapsed)
+
+    def get_tparking_total(self, veh_id, env=None):
+        return self._get(veh_id, self.t_total)
+
+    def update_tpark_elapsed(self, veh_id):
+        # parking timers are advanced by the kernel in step()
+        pass
+
+    def apply_acceleration(self, veh_ids, acc):
+        if not isinstance(veh_ids, (list, tuple, np.ndarray)):
+            veh_ids, acc = [veh_ids], [acc]
+        for veh_id, a in zip(veh_ids, acc):
+            if veh_id in self.index and a is not None:
+                self.accel[self.index[veh_id]] = a
+
+    def apply_lane_change(self, veh_ids, direction):
+        # lane choice follows the parking lifecycle, see _change_lanes
+        pass
+
+    def get_outflow_rate(self, time_span):
+        n = sum(t >= self.time - time_span for t in self.arrivals)
+        return 3600 * n / min(time_span, max(self.time, self.sim_step))
+
+    def get_inflow_rate(self, time_span):
+        n = sum(t >= self.time - time_span for t in self.departures)
+        return 3600 * n / min(time_span, max(self.time, self.sim_step))
+
+
+class FastKernel:
+    """Stand-in for flow's Kernel with the ``network`` and ``vehicle`` parts."""
+
+    def __init__(self, net_params, vehicles, sim_step, seed=None, params=None):
+        self.network = FastNetworkKernel(net_params)
+        self.vehicle = FastVehicleKernel(self.network, sim_step, params)
+        self.vehicles = vehicles
+        self.rng = np.random.default_rng(seed)
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def reset(self):
+        """Place the initial vehicles uniformly on the inflow edge."""
+        k = self.vehicle
+        p = k.params
+        k.reset()
+
+        types = [(t["veh_id"], t["num_vehicles"],
+                  t["acceleration_controller"][0].__name__ == "RLController")
+                 for t in self.vehicles.initial]
+        n = sum(num for _, num, _ in types)
+        if n == 0:
+            return
+        x = np.linspace(0, self.network.L_i, n, endpoint=False)[::-1]
+
+        start = 0
+        for veh_type, num, rl in types:
+            sl = slice(start, start + num)
+            k.add([f"{veh_type}_{i}" for i in range(num)], veh_type, x[sl],
+                  np.zeros(num), self.rng.integers(0, self.network.N_p, num),
+                  self.rng.uniform(p["tpark_min"], p["tpark_max"], num), rl=rl)
+            start += num
+
+    def simulation_step(self):
+        self.vehicle.step()
+
+
+class CurbsideFastEnv:
+    """Run a curbside env class on the NumPy kernel instead of SUMO.
+
+    Observations, rewards and the action space are taken from ``env_cls``
+    (e.g. CurbsideTrafficEnv), so the two backends produce the same
+    interface for the same policy.  make_create_fast_env builds it as a
+    gym.Env (see gym_fast_env).
+    """
+
+    def __init__(self, env_cls, env_params, net_params, vehicles, sim_step=0.1,
+                 seed=None, fast_params=None):
+        self.env_cls = env_cls
+        self.env_params = env_params
+        self.num_rl = env_params.additional_params["num_rl"]
+        self.sim_step = sim_step
+        self.snapshot = VehicleSnapshot()
+        self.encoder = ObservationEncoder.from_params(env_cls.OBS_FEATURES,
+                                                      env_params.additional_params)
+        self.k = FastKernel(net_params, vehicles, sim_step, seed, fast_params)
+        self.network = types.SimpleNamespace(name="curbside_fast", net_params=net_params,
+                                             geometry=self.k.network.geometry)
+        self.time_counter = 0
+        self.step_counter = 0
+        self.seed_keys = None
+        self.episode = 0
+
+        inflow = net_params.additional_params.get("inflow")
+        self.inflow = InflowInjector(inflow, self.k.network.N_p) if inflow else None
+
+        self.profiler = None
+        if env_params.additional_params.get("profile", False):
+            self.profiler = StepProfiler()
+            self.profiler.instrument_env(self)
+
+    @property
+    def observation_space(self):
+        return self.env_cls.observation_space.fget(self)
+
+    @property
+    def action_space(self):
+        return self.env_cls.action_space.fget(self)
+
+    @property
+    def sim_time(self):
+        return self.time_counter
+
+    def get_state(self):
+        return self.env_cls.get_state(self)
+
+    def compute_reward(self, rl_actions, **kwargs):
+        return self.env_cls.compute_reward(self, rl_actions, **kwargs)
+
+    def seed(self, seed=None):
+        self.k.seed(seed)
+        return [seed]
+
+    def seed_episodes(self, base, *keys):
+        """Seed episode e with derive_seed(base, *keys, e) from now on."""
+        self.seed_keys = (base, ) + keys
+        self.episode = 0
+
+    def reset(self):
+        if self.profiler is not None:
+            self.profiler.end_rollout()
+        if self.seed_keys is not None:
+            self.k.seed(derive_seed(*self.seed_keys, self.episode))
+            self.episode += 1
+        self.k.reset()
+        if self.inflow is not None:
+            duration = self.env_params.horizon * self.env_params.sims_per_step * self.sim_step
+            self.inflow.reset(duration, self.k.rng)
+        self.snapshot.clear()
+        self.time_counter = 0
+        self.step_counter = 0
+        return self.get_state()
+
+    def step(self, rl_actions):
+        for _ in range(self.env_params.sims_per_step):
+            if rl_actions is not None:
+                rl_ids = self.k.vehicle.get_rl_ids()[:self.num_rl]
+                space = self.action_space
+                acc = np.clip(rl_actions, space.low, space.high)
+                self.k.vehicle.apply_acceleration(rl_ids, acc[:len(rl_ids)])
+            if self.inflow is not None:
+                self.inflow.inject_fast(self.k.vehicle, self.time_counter * self.sim_step)
+            self.k.simulation_step()
+            self.time_counter += 1
+        self.step_counter += 1
+
+        obs = self.get_state()
+        reward = self.compute_reward(rl_actions, fail=False)
+        done = self.step_counter >= self.env_params.horizon \
+            or (self.k.vehicle.num_vehicles == 0
+                and (self.inflow is None or self.inflow.exhausted))
+        return obs, reward, done, {}
+
+    def terminate(self):
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def gym_fast_env():
+    """CurbsideFastEnv as a gym.Env, created on first use to defer the gym import."""
+    import gym
+
+    return type("CurbsideFastEnv", (CurbsideFastEnv, gym.Env), {})
+
+
+def make_create_fast_env(params, version=0):
+    """Counterpart of flow's make_create_env that builds a CurbsideFastEnv."""
+    if hasattr(params["env_name"], "agent_spaces"):
+        raise ValueError("The NumPy backend only runs single-agent curbside envs")
+    env_name = params["env_name"].__name__ + "Fast-v{}".format(version)
+
+    def create_env(*_):
+        sim_params = params["sim"]
+        return gym_fast_env()(params["env_name"], params["env"], params["net"],
+                              params["veh"], sim_step=sim_params.sim_step,
+                              seed=sim_params.seed)
+
+    return create_env, env_name
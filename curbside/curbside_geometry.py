@@ -0,0 +1,69 @@
+"""Edge and parking zone table of the curbside corridor.
+
+Kept free of flow imports, so that the NumPy backend (curbside_fastsim) can
+be used without SUMO or flow installed.
+"""
+from types import MappingProxyType
+
+import numpy as np
+
+
+class CorridorGeometry:
+    """Immutable edge and parking zone table of the curbside corridor.
+
+    Built once per network so that the per-step code does not have to parse
+    zone numbers out of edge names or recompute zone lengths and edge starts.
+    """
+
+    def __init__(self, additional_params):
+        L_p = additional_params["length_parking"]
+        L_i = additional_params["length_inflow"]
+        L_o = additional_params["length_outflow"]
+        N_p = additional_params["number_parking_zones"]
+
+        self.num_zones = N_p
+        self.zone_length = L_p/N_p
+        self.length = L_i + L_p + L_o
+        self.parking_start = L_i
+        self.parking_end = L_i + L_p
+
+        self.edges = ("inflow",) + tuple(f"parking_{i}" for i in range(N_p)) + ("outflow",)
+        self.edge_index = MappingProxyType({e: i for i, e in enumerate(self.edges)})
+        # edge id -> parking zone index, inflow and outflow are not zones
+        self.zone_of = MappingProxyType({f"parking_{i}": i for i in range(N_p)})
+
+        self.edge_starts = np.array([0] + [L_i + i*L_p/N_p for i in range(N_p)] + [L_i + L_p])
+        self.zone_starts = self.edge_starts[1:-1]
+        self.zone_centers = self.zone_starts + self.zone_length/2
+        # inflow and outflow have no curb lane, their lane 0 continues the
+        # first travel lane of the parking edges
+        self.lanes = additional_params["lanes"]
+        self.lane_offset = np.array([1] + [0]*N_p + [1])
+        for arr in [self.edge_starts, self.zone_starts, self.zone_centers, self.lane_offset]:
+            arr.setflags(write=False)
+
+    def zone(self, edge):
+        """Parking zone index of an edge, -1 for every other edge."""
+        return self.zone_of.get(edge, -1)
+
+    def zones(self, edges):
+        return np.array([self.zone_of.get(e, -1) for e in edges], dtype=int)
+
+    def edge_at(self, x):
+        """Index into self.edges for (an array of) global positions."""
+        return np.clip(np.searchsorted(self.edge_starts, x, side="right") - 1,
+                       0, len(self.edges) - 1)
+
+    def zone_at(self, x):
+        """Parking zone index for (an array of) global positions, -1 outside."""
+        i = self.edge_at(x)
+        return np.where((i >= 1) & (i <= self.num_zones), i - 1, -1)
+
+    def corridor_lanes(self, x, lanes):
+        """Lane indices that are comparable along the whole corridor, 0 is the curb."""
+        return np.asarray(lanes) + self.lane_offset[self.edge_at(x)]
+
+    def locate(self, x):
+        """(edge id, zone index) of a single global position."""
+        i = int(self.edge_at(x))
+        return self.edges[i], (i - 1 if 1 <= i <= self.num_zones else -1)
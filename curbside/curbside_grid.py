@@ -0,0 +1,168 @@
+"""Node, edge, connection and route specs of multi-block curbside networks.
+
+A network is ``rows`` parallel horizontal streets of ``blocks`` blocks
+each, optionally crossed by a vertical street at every block boundary, so
+``rows=1, cross_streets=False`` is a multi-block corridor and ``rows>1`` a
+street grid.  Streets are one-way, alternating in direction (even rows
+eastbound, odd rows westbound, even columns northbound, odd columns
+southbound), and each one starts with an entry edge and ends with an exit
+edge outside the grid.  Block edges of the streets selected by ``curb``
+have a curb lane (lane 0) next to the travel lanes.
+
+Every spec is built in one pass over the streets, so generation time and
+memory are linear in the number of edges.  Routes are only given for the
+entry edges (one per street, the whole street), so vehicles have to be
+placed on ``entry_edges`` (InitialConfig ``edges_distribution``).
+"""
+
+GRID_NET_PARAMS = {
+    # parallel horizontal streets, 1 for a corridor
+    "rows": 1,
+    # blocks along every horizontal street
+    "blocks": 4,
+    # vertical streets at every block boundary (required for rows > 1)
+    "cross_streets": True,
+    # length of the blocks along and across the horizontal streets, in m
+    "block_length": 100,
+    "block_width": 100,
+    # length of the entry and exit edges outside the grid, in m
+    "entry_length": 100,
+    # lanes of the curb edges, the other edges have one lane less
+    "lanes": 2,
+    "speed_limit": 10,
+    # streets with curb parking: all, horizontal or vertical
+    "curb": "horizontal",
+    "junction_type": "priority",
+}
+
+
+def edge_types(lanes, speed):
+    """Edge types with (curbType) and without (circulatorType) a curb lane."""
+    return [{"id": "curbType", "numLanes": lanes, "speed": speed},
+            {"id": "circulatorType", "numLanes": lanes - 1, "speed": speed}]
+
+
+class GridSpec:
+    """Specs of one multi-block network, in the formats of flow's Network."""
+
+    def __init__(self, params):
+        p = dict(GRID_NET_PARAMS, **params)
+        if p["rows"] > 1 and not p["cross_streets"]:
+            raise ValueError("A grid with rows > 1 needs cross_streets")
+        if p["curb"] not in ["all", "horizontal", "vertical"]:
+            raise ValueError("Unknown curb option {}".format(p["curb"]))
+        self.params = p
+
+        self.nodes = []
+        self.edges = []
+        # entry edge -> edges of its street
+        self.routes = {}
+        # node id -> ids of the edges entering and leaving it
+        self.incoming = {}
+        self.outgoing = {}
+        self.curb_edges = []
+        self.curb_set = set()
+        # first edge of every street, where vehicles enter the network
+        self.entry_edges = []
+        # edge id -> unit direction of travel
+        self.heading = {}
+
+        self._build()
+        self.connections = self._connections()
+
+    def _node(self, node_id, x, y):
+        self.nodes.append({"id": node_id, "x": x, "y": y,
+                           "type": self.params["junction_type"]})
+        self.incoming[node_id] = []
+        self.outgoing[node_id] = []
+
+    def _edge(self, edge_id, src, dst, length, curb, heading):
+        self.edges.append({"id": edge_id,
+                           "type": "curbType" if curb else "circulatorType",
+                           "from": src, "to": dst, "length": length})
+        self.outgoing[src].append(edge_id)
+        self.incoming[dst].append(edge_id)
+        self.heading[edge_id] = heading
+        if curb:
+            self.curb_edges.append(edge_id)
+            self.curb_set.add(edge_id)
+
+    def _street(self, name, nodes, ends, lengths, curb, heading):
+        """Entry edge, block edges and exit edge through the given nodes."""
+        entry, exit_ = ends
+        path = ["in_" + name] + [f"{name}_{i}" for i in range(len(nodes) - 1)] \
+            + ["out_" + name]
+        stops = [entry] + nodes + [exit_]
+        self.entry_edges.append(path[0])
+        for i, edge_id in enumerate(path):
+            block = 0 < i < len(path) - 1
+            self._edge(edge_id, stops[i], stops[i + 1], lengths[i],
+                       curb and block, heading)
+        self.routes[path[0]] = path
+
+    def _build(self):
+        p = self.params
+        rows, blocks = p["rows"], p["blocks"]
+        L, W, E = p["block_length"], p["block_width"], p["entry_length"]
+        cols = blocks + 1 if p["cross_streets"] else 0
+
+        # intersections, or the block boundaries of a corridor
+        for r in range(rows):
+            for c in range(blocks + 1):
+                self._node(f"x{r}_{c}", c * L, r * W)
+
+        for r in range(rows):
+            east = r % 2 == 0
+            self._node(f"w{r}", -E, r * W)
+            self._node(f"e{r}", blocks * L + E, r * W)
+            nodes = [f"x{r}_{c}" for c in range(blocks + 1)]
+            ends = (f"w{r}", f"e{r}")
+            if not east:
+                nodes, ends = nodes[::-1], ends[::-1]
+            self._street(f"h{r}", nodes, ends, [E] + [L] * blocks + [E],
+                         p["curb"] in ["all", "horizontal"], (1 if east else -1, 0))
+
+        for c in range(cols):
+            north = c % 2 == 0
+            self._node(f"s{c}", c * L, -E)
+            self._node(f"n{c}", c * L, (rows - 1) * W + E)
+            nodes = [f"x{r}_{c}" for r in range(rows)]
+            ends = (f"s{c}", f"n{c}")
+            if not north:
+                nodes, ends = nodes[::-1], ends[::-1]
+            self._street(f"v{c}", nodes, ends, [E] + [W] * (rows - 1) + [E],
+                         p["curb"] in ["all", "vertical"], (0, 1 if north else -1))
+
+    def _travel_lanes(self, edge_id):
+        lanes = self.params["lanes"]
+        return list(range(1, lanes)) if edge_id in self.curb_set else list(range(lanes - 1))
+
+    def _connections(self):
+        """Lane connections at every node, straight on and turning.
+
+        Straight on, travel lanes connect in order; right turns leave from
+        the rightmost and left turns from the leftmost travel lane.  Curb
+        lanes are never connected, vehicles enter and leave them on their
+        edge.
+        """
+        connections = {}
+        for node_id, incoming in self.incoming.items():
+            conns = []
+            for src in incoming:
+                hx, hy = self.heading[src]
+                for dst in self.outgoing[node_id]:
+                    from_lanes = self._travel_lanes(src)
+                    to_lanes = self._travel_lanes(dst)
+                    gx, gy = self.heading[dst]
+                    turn = hx * gy - hy * gx  # > 0 left, < 0 right
+                    if turn == 0:
+                        pairs = zip(from_lanes, to_lanes)
+                    elif turn < 0:
+                        pairs = [(from_lanes[0], to_lanes[0])]
+                    else:
+                        pairs = [(from_lanes[-1], to_lanes[-1])]
+                    conns += [{"from": src, "to": dst, "fromLane": a, "toLane": b}
+                              for a, b in pairs]
+            if conns:
+                connections[node_id] = conns
+        return connections
@@ -0,0 +1,200 @@
+"""Precomputed vehicle arrivals for the curbside corridor.
+
+An arrival schedule holds, as NumPy arrays sorted by time, the arrival time,
+vehicle type, target parking zone and parking duration of every vehicle of
+one episode.  It is drawn once at reset from the ``inflow`` net parameter,
+e.g.::
+
+    {"kind": "poisson", "rate": 900, "rl_fraction": 0.1}
+    {"kind": "varying", "rates": [300, 900, 600], "interval": 600}
+    {"kind": "trace", "path": "arrivals.csv"}
+
+and the vehicles that are due are handed to the simulator at every
+simulation step; the NumPy kernel queues them until the entry is clear.
+"""
+import collections
+
+import numpy as np
+
+INFLOW_PARAMS = {
+    # poisson, varying or trace
+    "kind": "poisson",
+    # arrival rate of the poisson schedule, in veh/hour
+    "rate": 600,
+    # rates of the consecutive intervals of the varying schedule, in veh/hour
+    # (the last one holds until the end of the episode), and their length in s
+    "rates": [600],
+    "interval": 600,
+    # csv or npz file with a time column (s) and optionally type, pzone, tpark
+    "path": None,
+    # vehicle types of VehicleParams: share of RL vehicles among the arrivals
+    "human_type": "human",
+    "rl_type": "rl",
+    "rl_fraction": 0.1,
+    # probabilities of the target zones, uniform if None
+    "zone_probs": None,
+    # range of the parking duration, in s
+    "tpark_min": 60,
+    "tpark_max": 600,
+    # insertion speed on the inflow edge, in m/s
+    "speed": 5,
+}
+
+
+class ArrivalSchedule:
+    """Arrivals of one episode, sorted by time."""
+
+    __slots__ = ["time", "types", "type_index", "pzone", "tpark"]
+
+    def __init__(self, time, types, type_index, pzone, tpark):
+        order = np.argsort(time, kind="stable")
+        self.time = np.asarray(time, dtype=float)[order]
+        self.types = tuple(types)
+        self.type_index = np.asarray(type_index, dtype=np.int8)[order]
+        self.pzone = np.asarray(pzone, dtype=int)[order]
+        self.tpark = np.asarray(tpark, dtype=float)[order]
+
+    def __len__(self):
+        return len(self.time)
+
+    def window(self, t0, t1):
+        """Slice of the arrivals with t0 < time <= t1."""
+        return slice(*np.searchsorted(self.time, [t0, t1], side="right"))
+
+
+def poisson_times(rate, duration, rng):
+    """Arrival times of a poisson process with rate veh/hour."""
+    n = rng.poisson(rate * duration / 3600)
+    return np.sort(rng.uniform(0, duration, n))
+
+
+def varying_times(rates, interval, duration, rng):
+    """Piecewise constant poisson arrivals, one rate per interval."""
+    starts = np.arange(0, duration, interval)
+    rates = np.asarray(rates, dtype=float)
+    rates = np.concatenate([rates, np.full(max(0, len(starts) - len(rates)), rates[-1])])
+    times = [start + poisson_times(rate, min(interval, duration - start), rng)
+             for start, rate in zip(starts, rates)]
+    return np.concatenate(times) if times else np.zeros(0)
+
+
+def load_trace(path):
+    """Columns of a csv (with header) or npz arrival trace."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return dict(data)
+    data = np.genfromtxt(path, delimiter=",", names=True, dtype=None, encoding=None)
+    return {name: np.atleast_1d(data[name]) for name in data.dtype.names}
+
+
+def make_schedule(params, num_zones, duration, rng):
+    """Draw the arrival schedule of one episode."""
+    p = dict(INFLOW_PARAMS, **params)
+    types = (p["human_type"], p["rl_type"])
+    trace = {}
+
+    if p["kind"] == "poisson":
+        time = poisson_times(p["rate"], duration, rng)
+    elif p["kind"] == "varying":
+        time = varying_times(p["rates"], p["interval"], duration, rng)
+    elif p["kind"] == "trace":
+        trace = load_trace(p["path"])
+        time = np.asarray(trace["time"], dtype=float)
+    else:
+        raise ValueError("Unknown inflow kind {}".format(p["kind"]))
+    n = len(time)
+
+    # columns missing from a trace are drawn like for the generated schedules
+    if "type" in trace:
+        names = [str(t) for t in trace["type"]]
+        types = tuple(sorted(set(names) | set(types)))
+        type_index = np.array([types.index(t) for t in names])
+    else:
+        type_index = (rng.random(n) < p["rl_fraction"]).astype(int)
+    pzone = trace["pzone"] if "pzone" in trace else \
+        rng.choice(num_zones, n, p=p["zone_probs"])
+    tpark = trace["tpark"] if "tpark" in trace else \
+        rng.uniform(p["tpark_min"], p["tpark_max"], n)
+
+    return ArrivalSchedule(time, types, type_index, pzone, tpark)
+
+
+class InflowInjector:
+    """Hands out the vehicles of the episode's schedule as time advances."""
+
+    def __init__(self, params, num_zones):
+        self.params = dict(INFLOW_PARAMS, **params)
+        self.num_zones = num_zones
+        self.schedule = None
+        self.time = 0
+        self.count = 0
+        # vehicles inserted in SUMO that have not departed yet: id -> pzone
+        self.pending = {}
+        # due vehicles waiting for a free entry in the NumPy kernel:
+        # (id, type, pzone, tpark)
+        self.queue = collections.deque()
+
+    def reset(self, duration, rng):
+        self.schedule = make_schedule(self.params, self.num_zones, duration, rng)
+        self.time = -np.inf
+        self.count = 0
+        self.pending = {}
+        self.queue.clear()
+
+    @property
+    def exhausted(self):
+        """Whether every vehicle of the schedule has been inserted."""
+        return not self.queue and (not len(self.schedule)
+                                   or self.time >= self.schedule.time[-1])
+
+    def due(self, time):
+        """(ids, types, pzone, tpark) of the vehicles arriving up to time."""
+        sl = self.schedule.window(self.time, time)
+        self.time = time
+        n = sl.stop - sl.start
+        types = [self.schedule.types[i] for i in self.schedule.type_index[sl]]
+        ids = ["{}_in_{}".format(t, self.count + i) for i, t in enumerate(types)]
+        self.count += n
+        return ids, types, self.schedule.pzone[sl], self.schedule.tpark[sl]
+
+    def inject(self, env, time):
+        """Insert the due vehicles into a flow kernel at the start of the inflow edge.
+
+        SUMO delays the departure of vehicles whose entry is blocked by
+        itself, and flow's kernel only knows a vehicle once it has departed,
+        so target zones are applied with set_pzone then (see apply_pending).
+        Parking durations are preset in the parking state machine.
+        """
+        ids, types, pzone, tpark = self.due(time)
+        for veh_id, veh_type, zone, total in zip(ids, types, pzone.tolist(), tpark.tolist()):
+            env.k.vehicle.add(veh_id, veh_type, edge="inflow", pos=0, lane=0,
+                              speed=self.params["speed"])
+            env.parking_states.preset_total[veh_id] = total
+            self.pending[veh_id] = zone
+
+    def inject_fast(self, vehicles, time):
+        """Queue the due vehicles and insert the first one if the entry is clear.
+
+        The entry is clear when no vehicle of the travel lane is within s0 of
+        the start of the corridor, so at most one vehicle enters per step and
+        the others keep their place in the queue.
+        """
+        ids, types, pzone, tpark = self.due(time)
+        self.queue.extend(zip(ids, types, pzone.tolist(), tpark.tolist()))
+        if not self.queue:
+            return
+        rear = vehicles.x - vehicles.length
+        if np.any(~vehicles.curb & (rear < vehicles.params["s0"])):
+            return
+        veh_id, veh_type, zone, total = self.queue.popleft()
+        vehicles.add([veh_id], veh_type, np.zeros(1), np.full(1, float(self.params["speed"])),
+                     np.array([zone]), np.array([total]),
+                     rl=veh_type == self.params["rl_type"])
+
+    def apply_pending(self, env):
+        """Set the target zone of the inserted vehicles that have departed."""
+        if not self.pending:
+            return
+        present = set(env.k.vehicle.get_ids())
+        for veh_id in [i for i in self.pending if i in present]:
+            env.k.vehicle.set_pzone(veh_id, self.pending.pop(veh_id))
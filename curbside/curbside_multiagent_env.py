@@ -0,0 +1,78 @@
+"""Multi-agent curbside env, one agent per RL vehicle.
+
+Kept apart from curbside_env because flow's MultiEnv imports ray.rllib,
+which the single-agent envs and the dry runs of train.py do not need.
+"""
+from flow.envs.multiagent.base import MultiEnv
+from gym.spaces.box import Box
+
+import numpy as np
+
+from curbside_env import CurbsideTrafficEnv
+from curbside_observation import ObservationEncoder
+from curbside_state import state_translation
+
+
+class CurbsideTrafficMultiEnv(CurbsideTrafficEnv, MultiEnv):
+	"""Every RL vehicle is an agent with its own observation, action and reward.
+
+	Agents appear and disappear with the vehicles, and all of them share one
+	policy, so the network size does not depend on the number of RL
+	vehicles; num_rl is only the initial capacity of the observation buffer.
+	"""
+
+	@classmethod
+	def agent_spaces(cls, env_params):
+		"""Observation and action space of a single agent, without a simulation."""
+		params = env_params.additional_params
+		encoder = ObservationEncoder.from_params(cls.OBS_FEATURES, params)
+		obs_space = Box(low=-1, high=1, shape=(encoder.width, ), dtype=np.float32)
+		act_space = Box(low=-abs(params["max_decel"]), high=params["max_accel"],
+		                shape=(1, ), dtype=np.float32)
+		return obs_space, act_space
+
+	@property
+	def observation_space(self):
+	    """See class definition."""
+	    return Box(low=-1, high=1, shape=(self.encoder.width, ), dtype=np.float32)
+
+	@property
+	def action_space(self):
+	    """See class definition."""
+	    return self.agent_spaces(self.env_params)[1]
+
+	def get_state(self, rl_id=None, **kwargs):
+		"""See class definition."""
+		return self.encoder.encode_agents(self)
+
+	def _apply_rl_actions(self, rl_actions):
+		"""See class definition."""
+		if not rl_actions:
+			return
+		rl_ids = list(rl_actions)
+		self.k.vehicle.apply_acceleration(
+			rl_ids, [float(np.ravel(rl_actions[rl_id])[0]) for rl_id in rl_ids])
+		for rl_id in rl_ids:
+			target_lane = self.k.vehicle.get_lane_changing_controller(
+							rl_id).get_action(self)
+			self.k.vehicle.apply_lane_change(rl_id, direction=target_lane)
+
+	def compute_reward(self, rl_actions, **kwargs):
+		"""See class definition."""
+		if rl_actions is None:
+			return {}
+
+		snap = self.snapshot.update(self)
+		rl = snap.rl_slots
+		ids = [snap.ids[i] for i in rl]
+
+		if kwargs["fail"]:
+			return dict.fromkeys(ids, -10)
+
+		done = snap.state[rl] >= state_translation["parked"]
+		on_spot = snap.edge_zone[rl] == snap.pzone[rl]
+
+		# same terms as the centralized reward, per vehicle
+		eta_cost, eta_reward = 1e-4, 1e-2
+		reward = eta_reward * np.where(done, snap.speed[rl], on_spot) - eta_cost
+		return dict(zip(ids, reward.tolist()))
@@ -0,0 +1,84 @@
+"""On-disk cache of generated SUMO network files.
+
+The key is a hash of the network parameters and the vehicle configuration.
+The first process that misses takes an exclusive file lock, lets flow
+generate the network as usual (specify_* + netconvert) and stores the
+resulting .net.xml; every other worker, episode or experiment with the same
+key loads the cached file as a network template instead.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# parameters that do not change the generated network
+IGNORED_NET_PARAMS = ["net_cache", "inflow", "curb_spots"]
+
+
+def network_key(additional_params, vehicles):
+    """Content hash of the network parameters and vehicle types."""
+    params = {k: v for k, v in additional_params.items() if k not in IGNORED_NET_PARAMS}
+    types = [{"veh_id": t["veh_id"],
+              "num_vehicles": t.get("num_vehicles", 0),
+              "controllers": [t[c][0].__name__ for c in
+                              ["acceleration_controller", "lane_change_controller",
+                               "routing_controller"] if t.get(c)]}
+             for t in getattr(vehicles, "initial", [])]
+    blob = json.dumps({"net": params, "vehicles": types}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+class NetworkCache:
+    """Directory of cached networks, one sub-directory per key."""
+
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = None
+
+    def net_file(self, key):
+        return os.path.join(self.root, key, "network.net.xml")
+
+    def lookup(self, key):
+        """Path of the cached .net.xml, or None."""
+        path = self.net_file(key)
+        return path if os.path.isfile(path) else None
+
+    def acquire(self, key):
+        """Block until this process may build key; returns a path if another one did."""
+        self._lock = open(os.path.join(self.root, key + ".lock"), "w")
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        path = self.lookup(key)
+        if path is not None:
+            self.release()
+        return path
+
+    def store(self, key, net_file):
+        """Atomically copy a generated network into the cache and release the lock."""
+        try:
+            tmp = tempfile.mkdtemp(dir=self.root)
+            shutil.copy(net_file, os.path.join(tmp, "network.net.xml"))
+            try:
+                os.replace(tmp, os.path.join(self.root, key))
+            except OSError:
+                # stored concurrently by a process that did not take the lock
+                shutil.rmtree(tmp, ignore_errors=True)
+        finally:
+            self.release()
+        return self.lookup(key)
+
+    @property
+    def building(self):
+        """Whether this process holds the lock and has to store the network."""
+        return self._lock is not None
+
+    def release(self):
+        if self._lock is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+            self._lock.close()
+            self._lock = None
+
+    def __del__(self):
+        self.release()
@@ -0,0 +1,115 @@
+"""Fixed-size observations of the controlled vehicles.
+
+One row per RL slot is written into a preallocated float32 buffer from the
+vehicle snapshot: the per-vehicle features, optionally a validity flag
+(rows of RL vehicles that are not in the network are all zero) and
+optionally the K nearest vehicles within a radius along the corridor.
+"""
+import numpy as np
+
+from curbside_state import PARKED
+
+# per-vehicle features, in column order
+FEATURES = ("x", "dist", "pzone", "speed", "parked", "lead_speed", "lead_head")
+# per-neighbour features: relative position / radius, relative speed, lane
+NEIGHBOR_FEATURES = ("dx", "dv", "lane")
+
+
+class ObservationEncoder:
+    """Writes the observation of the first num_rl RL vehicles in place."""
+
+    def __init__(self, num_rl, features=FEATURES, mask=False, neighbors=0, radius=50.):
+        self.num_rl = num_rl
+        self.features = tuple(features)
+        self.mask = mask
+        self.neighbors = neighbors
+        self.radius = radius
+
+        self.mask_col = len(self.features)
+        self.neighbor_col = self.mask_col + int(mask)
+        self.width = self.neighbor_col + neighbors * len(NEIGHBOR_FEATURES)
+        self.buffer = np.zeros((num_rl, self.width), dtype=np.float32)
+
+    @classmethod
+    def from_params(cls, features, additional_params):
+        """Encoder configured by the obs_* env parameters."""
+        return cls(additional_params["num_rl"], features,
+                   mask=additional_params.get("obs_mask", False),
+                   neighbors=additional_params.get("obs_neighbors", 0),
+                   radius=additional_params.get("obs_radius", 50.))
+
+    @property
+    def size(self):
+        return self.buffer.size
+
+    def update(self, env):
+        """Refill the buffer for the current step, returns the RL slots encoded."""
+        snap = env.snapshot.update(env)
+        geometry = env.network.geometry
+        max_speed = env.k.network.max_speed()*3
+        scale = {"x": geometry.length, "dist": geometry.length,
+                 "pzone": geometry.num_zones, "speed": max_speed,
+                 "lead_speed": max_speed, "lead_head": env.k.network.length()}
+
+        rl = snap.rl_slots[:self.num_rl]
+        n = len(rl)
+        out = self.buffer
+        out.fill(0)
+
+        for j, name in enumerate(self.features):
+            if name == "parked":
+                # 0 = not yet parked, 1 = parking completed, over the number of states
+                out[:n, j] = (snap.state[rl] >= PARKED) / 4
+            else:
+                out[:n, j] = getattr(snap, name)[rl] / scale[name]
+
+        if self.mask:
+            out[:n, self.mask_col] = 1
+
+        if self.neighbors and n:
+            self._encode_neighbors(snap, rl, max_speed, geometry.lanes)
+        return rl
+
+    def _encode_neighbors(self, snap, rl, max_speed, lanes):
+        n, k = len(rl), min(self.neighbors, len(snap) - 1)
+        if k <= 0:
+            return
+        dx = snap.x[None, :] - snap.x[rl, None]
+        dist = np.abs(dx)
+        dist[np.arange(n), rl] = np.inf
+        dist[dist > self.radius] = np.inf
+
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        nearest = np.take_along_axis(nearest, np.argsort(
+            np.take_along_axis(dist, nearest, 1), axis=1), 1)
+        valid = np.isfinite(np.take_along_axis(dist, nearest, 1))
+
+        values = [np.take_along_axis(dx, nearest, 1) / self.radius,
+                  (snap.speed[nearest] - snap.speed[rl, None]) / max_speed,
+                  (snap.corridor_lane[nearest] + 1) / lanes]
+        width = len(NEIGHBOR_FEATURES)
+        for f, value in enumerate(values):
+            cols = self.neighbor_col + np.arange(k) * width + f
+            self.buffer[:n, cols] = np.where(valid, value, 0)
+
+    def encode(self, env):
+        """Flat observation of the current step.
+
+        A copy of the buffer, since RLlib keeps the returned observations
+        in its sample batches.
+        """
+        self.update(env)
+        return self.buffer.flatten()
+
+    def encode_agents(self, env):
+        """Observation row of every RL vehicle in the network, keyed by id.
+
+        The buffer grows (doubling) when more RL vehicles are present than
+        it has rows, so num_rl only sets the initial capacity.
+        """
+        snap = env.snapshot.update(env)
+        if len(snap.rl_slots) > self.num_rl:
+            self.num_rl = max(len(snap.rl_slots), 2 * self.num_rl)
+            self.buffer = np.zeros((self.num_rl, self.width), dtype=np.float32)
+        rl = self.update(env)
+        return {snap.ids[i]: self.buffer[j].copy() for j, i in enumerate(rl)}
@@ -0,0 +1,135 @@
+import numpy as np
+
+# zones ahead of the current one searched for a free curb spot
+LOOKAHEAD = 5
+
+
+class ParkingOccupancy:
+    """Vehicles in the curb lane (lane 0) of every parking zone.
+
+    Updated once per simulation step from the edge and lane of all vehicles,
+    after which "is zone i free" and "nearest free zone within +/-k" are
+    answered from a per-zone count instead of scanning get_ids_by_edge.
+    """
+
+    def __init__(self, num_zones):
+        self.num_zones = num_zones
+        self.clear()
+
+    def clear(self):
+        self.time = None
+        self.count = np.zeros(self.num_zones, dtype=int)
+        self.zone_of = {}
+
+    def update(self, env):
+        """Refresh the index if the simulation has advanced since the last call."""
+        if self.time == env.time_counter:
+            return self
+
+        k = env.k.vehicle
+        zone_of = env.network.geometry.zone_of
+        ids = k.get_ids()
+        self.zone_of = {veh_id: zone_of[edge]
+                        for veh_id, edge, lane in zip(ids, k.get_edge(ids), k.get_lane(ids))
+                        if lane == 0 and edge in zone_of}
+        self.count = np.bincount(np.fromiter(self.zone_of.values(), dtype=int),
+                                 minlength=self.num_zones)[:self.num_zones]
+        self.time = env.time_counter
+        return self
+
+    def occupied(self, zone, exclude=None):
+        """Number of vehicles at the curb of zone, not counting ``exclude``."""
+        if not 0 <= zone < len(self.count):
+            return 0
+        return int(self.count[zone]) - int(self.zone_of.get(exclude) == zone)
+
+    def is_free(self, zone, exclude=None):
+        return self.occupied(zone, exclude) == 0
+
+    def free_mask(self, exclude=None):
+        """Boolean array of the free zones."""
+        free = self.count == 0
+        own = self.zone_of.get(exclude)
+        if own is not None and self.count[own] == 1:
+            free[own] = True
+        return free
+
+    def nearest_free(self, zone, k, exclude=None, lo=0, hi=None):
+        """Closest free zone to ``zone`` within +/-k, restricted to [lo, hi).
+
+        Offsets are tried in the order 0, -1, +1, -2, +2, ...; None is
+        returned if every zone in the window is taken.
+        """
+        hi = self.num_zones if hi is None else min(hi, self.num_zones)
+        for i in range(k+1):
+            for z in ([zone] if i == 0 else [zone-i, zone+i]):
+                if lo <= z < hi and self.is_free(z, exclude):
+                    return z
+        return None
+
+
+def search_offsets(k):
+    """Zone offsets in the order they are tried: 0, -1, +1, ..., -k, +k."""
+    offsets = np.zeros(2*k + 1, dtype=int)
+    offsets[1::2] = -np.arange(1, k + 1)
+    offsets[2::2] = np.arange(1, k + 1)
+    return offsets
+
+
+def assign_free_zones(target, lo, hi, free, priority):
+    """Nearest free zone to the target of every searching vehicle.
+
+    Vehicle i searches the zones [lo[i], hi[i]] in the order target[i],
+    target[i]-1, target[i]+1, ...; ``free`` is the bitmap of the zones
+    nobody parks in.  Every zone is given to at most one vehicle, and the
+    result is the same as letting the vehicles pick one after the other
+    in increasing ``priority``.  Returns the assigned zones, -1 where the
+    window has no free zone left.
+    """
+    n = len(target)
+    zones = np.full(n, -1)
+    if n == 0:
+        return zones
+
+    offsets = search_offsets(int(np.max(hi - lo)))
+    cand = target[:, None] + offsets[None, :]
+    valid = (cand >= lo[:, None]) & (cand <= hi[:, None])
+    cand = np.where(valid, cand, 0)
+    ok = valid & free[cand]
+    columns = np.arange(cand.shape[1])
+
+    rank = np.empty(n, dtype=int)
+    rank[np.argsort(priority, kind="stable")] = np.arange(n)
+    holder = np.full(len(free), -1)
+    best = np.empty(len(free), dtype=int)
+    # next candidate column of every vehicle
+    col = np.zeros(n, dtype=int)
+
+    # deferred acceptance: each round the unassigned vehicles claim their
+    # next candidate, a zone keeps the best ranked of its holder and
+    # claimants, and the rejected or displaced vehicles move on
+    pending = np.arange(n)
+    while len(pending):
+        left = ok[pending] & (columns[None, :] >= col[pending, None])
+        has = left.any(1)
+        pending, left = pending[has], left[has]
+        if not len(pending):
+            break
+        col[pending] = left.argmax(1)
+        claim = cand[pending, col[pending]]
+
+        best.fill(n)
+        held = holder >= 0
+        best[held] = rank[holder[held]]
+        np.minimum.at(best, claim, rank[pending])
+        won = rank[pending] == best[claim]
+
+        displaced = holder[claim[won]]
+        displaced = displaced[displaced >= 0]
+        holder[claim[won]] = pending[won]
+        pending = np.concatenate([pending[~won], displaced])
+        col[pending] += 1
+
+    held = np.flatnonzero(holder >= 0)
+    zones[holder[held]] = held
+    return zones
@@ -0,0 +1,114 @@
+"""Pure NumPy runtime for trained curbside fcnet policies.
+
+``model_training/export_policy.py`` extracts the weights of the action
+branch of an RLlib fully connected model, its observation filter and the
+action bounds from a checkpoint into one ``.npz`` file.  ``NumpyPolicy``
+loads that file and computes deterministic actions for batches of
+observations, without Ray or TensorFlow.
+"""
+import re
+
+import numpy as np
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    "linear": lambda x: x,
+}
+
+# fc1 / fc_1 (hidden layers) and fc_out, as named by the RLlib fcnet versions
+LAYER_PATTERN = re.compile(r"fc_?(\d+|out)/")
+
+
+def _layer_order(name):
+    label = LAYER_PATTERN.search(name).group(1)
+    return float("inf") if label == "out" else int(label)
+
+
+def extract_policy(weights, obs_filter, action_space, activation="tanh"):
+    """Arrays describing a policy, from the RLlib variable dict and filter.
+
+    The value function branch is dropped.  With a diagonal Gaussian
+    action distribution only the mean half of the output layer is kept,
+    which is the deterministic action.
+    """
+    kernels = sorted((n for n in weights if LAYER_PATTERN.search(n) and "value" not in n
+                      and re.search(r"(kernel|weights)", n)), key=_layer_order)
+    biases = sorted((n for n in weights if LAYER_PATTERN.search(n) and "value" not in n
+                     and re.search(r"bias", n)), key=_layer_order)
+    if not kernels or len(kernels) != len(biases):
+        raise ValueError("Not a fully connected policy: {}".format(sorted(weights)))
+
+    act_dim = int(np.prod(action_space.shape))
+    arrays = {"num_layers": len(kernels),
+              "activation": np.array(activation),
+              "action_low": np.asarray(action_space.low, dtype=np.float32),
+              "action_high": np.asarray(action_space.high, dtype=np.float32)}
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        W, b = np.asarray(weights[kernel]), np.asarray(weights[bias])
+        if i == len(kernels) - 1 and W.shape[1] == 2 * act_dim:
+            W, b = W[:, :act_dim], b[:act_dim]
+        arrays["W{}".format(i)] = W.astype(np.float32)
+        arrays["b{}".format(i)] = b.astype(np.float32)
+
+    # MeanStdFilter; NoFilter has no running statistics
+    rs = getattr(obs_filter, "rs", None)
+    if rs is not None:
+        arrays["filter_mean"] = np.asarray(rs.mean, dtype=np.float32)
+        arrays["filter_std"] = np.asarray(rs.std, dtype=np.float32)
+        arrays["filter_flags"] = np.array([obs_filter.demean, obs_filter.destd])
+        arrays["filter_clip"] = np.float32(obs_filter.clip or 0)
+    return arrays
+
+
+def save_policy(path, arrays):
+    np.savez(path, **arrays)
+
+
+class NumpyPolicy:
+    """Deterministic actions of an exported policy for batches of observations."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            arrays = dict(data)
+        n = int(arrays["num_layers"])
+        self.weights = [arrays["W{}".format(i)] for i in range(n)]
+        self.biases = [arrays["b{}".format(i)] for i in range(n)]
+        self.activation = ACTIVATIONS[str(arrays["activation"])]
+        self.low = arrays["action_low"]
+        self.high = arrays["action_high"]
+
+        self.mean = arrays.get("filter_mean")
+        if self.mean is not None:
+            self.std = arrays["filter_std"]
+            self.demean, self.destd = arrays["filter_flags"]
+            self.clip = float(arrays["filter_clip"])
+
+    @property
+    def obs_dim(self):
+        return self.weights[0].shape[0]
+
+    def filter(self, obs):
+        """Apply the observation filter as RLlib's MeanStdFilter does."""
+        if self.mean is None:
+            return obs
+        if self.demean:
+            obs = obs - self.mean
+        if self.destd:
+            obs = obs / (self.std + 1e-8)
+        if self.clip:
+            obs = np.clip(obs, -self.clip, self.clip)
+        return obs
+
+    def compute_actions(self, obs_batch):
+        """Actions for an (n, obs_dim) batch, clipped to the action space."""
+        x = self.filter(np.asarray(obs_batch, dtype=np.float32))
+        last = len(self.weights) - 1
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ W + b
+            if i < last:
+                x = self.activation(x)
+        return np.clip(x.reshape((len(x), ) + self.low.shape), self.low, self.high)
+
+    def compute_action(self, obs):
+        return self.compute_actions(np.asarray(obs)[None])[0]
@@ -0,0 +1,158 @@
+"""Opt-in timers and call counters for curbside env steps.
+
+Enable with ``env_params.additional_params["profile"] = True``.  The
+profiler then wraps the simulator step, the kernel vehicle accessors, the
+curbside controller methods and the env's observation/reward functions,
+and aggregates calls and wall time per rollout.  Results can be written to
+JSON/CSV or reported as RLlib custom metrics through
+``make_profiling_callbacks``.
+"""
+import collections
+import csv
+import functools
+import json
+import time
+
+KERNEL_METHODS = [
+    "get_ids", "get_rl_ids", "get_ids_by_edge", "get_edge", "get_lane",
+    "get_speed", "get_position", "get_x_by_id", "get_length", "get_leader",
+    "get_headway", "get_state", "set_state", "get_pzone", "set_pzone",
+    "get_global_position", "get_distance_to_pzone", "get_tparking_elapsed",
+    "get_tparking_total", "apply_acceleration", "apply_lane_change",
+]
+
+CONTROLLER_METHODS = {
+    "curbsideAccelController": ["get_accel", "park", "drive_normal", "slow_down"],
+    "curbsideLaneChangeController": ["get_lane_change_action", "update_state"],
+    "curbsideRouter": ["choose_route", "check_parking_occupied"],
+}
+
+
+class StepProfiler:
+    """Wall time and call counts per instrumented name, aggregated per rollout."""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.total = collections.defaultdict(float)
+        self.rollouts = []
+
+    def add(self, name, dt):
+        self.calls[name] += 1
+        self.total[name] += dt
+
+    def timed(self, name, fn):
+        """Wrap fn so that each call is counted and timed under name."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - t)
+        return wrapper
+
+    def summary(self):
+        return {name: {"calls": self.calls[name],
+                       "total": self.total[name],
+                       "mean": self.total[name] / self.calls[name]}
+                for name in sorted(self.calls)}
+
+    def end_rollout(self):
+        """Store the counters of the finished rollout and start new ones."""
+        if self.calls:
+            self.rollouts.append(self.summary())
+        self.calls = collections.Counter()
+        self.total = collections.defaultdict(float)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"rollouts": self.rollouts, "current": self.summary()}, f, indent=4)
+
+    def to_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rollout", "name", "calls", "total", "mean"])
+            for i, rollout in enumerate(self.rollouts + [self.summary()]):
+                for name, s in rollout.items():
+                    writer.writerow([i, name, s["calls"], s["total"], s["mean"]])
+
+    def instrument_env(self, env):
+        """Wrap the env, its simulator step and its vehicle kernel accessors."""
+        for name in ["get_state", "compute_reward", "step"]:
+            setattr(env, name, self.timed(name, getattr(env, name)))
+
+        # flow's kernel steps through k.simulation, the NumPy kernel through k
+        simulation = getattr(env.k, "simulation", env.k)
+        simulation.simulation_step = self.timed("simulation_step",
+                                                simulation.simulation_step)
+
+        self.instrument_vehicle(env.k.vehicle)
+
+    def instrument_vehicle(self, vehicle):
+        """Wrap the accessors of a vehicle kernel, once per kernel object.
+
+        flow replaces ``env.k.vehicle`` with a copy of the initial vehicles on
+        every restart, so envs call this again after each reset.
+        """
+        if vehicle.__dict__.get("_profiled", False):
+            return
+        for name in KERNEL_METHODS:
+            if hasattr(vehicle, name):
+                setattr(vehicle, name, self.timed("vehicle." + name, getattr(vehicle, name)))
+        vehicle._profiled = True
+
+
+def instrument_controllers(*classes):
+    """Time the curbside controller methods of the given classes.
+
+    The wrappers are installed on the classes once and only record when the
+    env passed to the method carries a profiler, so uninstrumented envs pay
+    a single attribute lookup.
+    """
+    for cls in classes:
+        if getattr(cls, "_profiled", False):
+            continue
+        for name in CONTROLLER_METHODS.get(cls.__name__, []):
+            setattr(cls, name, _controller_timer(cls.__name__ + "." + name,
+                                                 getattr(cls, name)))
+        cls._profiled = True
+
+
+def _controller_timer(name, fn):
+    @functools.wraps(fn)
+    def wrapper(self, env, *args, **kwargs):
+        profiler = getattr(env, "profiler", None)
+        if profiler is None:
+            return fn(self, env, *args, **kwargs)
+        t = time.perf_counter()
+        try:
+            return fn(self, env, *args, **kwargs)
+        finally:
+            profiler.add(name, time.perf_counter() - t)
+    return wrapper
+
+
+def make_profiling_callbacks():
+    """RLlib callbacks reporting the profiler totals as custom metrics."""
+
+    def on_episode_end(info):
+        # only the sub-env whose episode ended, the others are mid-episode
+        envs = info["env"].get_unwrapped()
+        index = info.get("env_index")
+        if index is None:
+            if len(envs) != 1:
+                # older RLlib does not tell which sub-env finished
+                return
+            index = 0
+        profiler = getattr(envs[index], "profiler", None)
+        if profiler is None:
+            return
+        metrics = {}
+        for name, s in profiler.summary().items():
+            metrics["time_" + name] = s["total"]
+            metrics["calls_" + name] = s["calls"]
+        info["episode"].custom_metrics.update(metrics)
+        # the counters belong to this episode, the next one starts from zero
+        profiler.end_rollout()
+
+    return {"on_episode_end": on_episode_end}
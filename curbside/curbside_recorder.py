@@ -0,0 +1,194 @@
+"""Chunked columnar writers for rollout and emission data.
+
+Rows are appended into preallocated NumPy column buffers; whenever
+``chunk_size`` rows are buffered they are written out as one part file
+(compressed ``.npz``, or Parquet if pyarrow is installed and requested), so
+memory stays bounded no matter how long or how many rollouts are recorded.
+"""
+import glob
+import os
+
+import numpy as np
+
+ROLLOUT_COLUMNS = {
+    "rollout": np.int32,
+    "t": np.int32,
+    "veh_id": object,
+    "edge": object,
+    "pzone": np.int16,
+    "lane": np.int8,
+    "state": np.int8,
+    "speed": np.float32,
+    "position": np.float32,
+    "reward": np.float32,
+}
+
+EMISSION_COLUMNS = {
+    "rollout": np.int32,
+    "time": np.float64,
+    "id": object,
+    "type": object,
+    "speed": np.float32,
+    "x": np.float32,
+    "edge_id": object,
+    "lane_number": np.int8,
+    "relative_position": np.float32,
+    "headway": np.float32,
+    "state": np.int8,
+    "pzone": np.int16,
+}
+
+
+def part_files(path):
+    """Part files of any format under ``path``, including sub-directories."""
+    return sorted(fn for fmt in ["npz", "parquet", "csv"]
+                  for fn in glob.glob(os.path.join(path, "**", "part-*." + fmt),
+                                      recursive=True))
+
+
+def clear_parts(path):
+    """Remove the part files left under ``path`` by an earlier run."""
+    for fn in part_files(path):
+        os.remove(fn)
+
+
+class ColumnarWriter:
+    """Buffer rows column-wise and flush them in chunks to part files in ``path``.
+
+    Part files of an earlier run under ``path`` are removed first, as
+    load_columns would read them with the new ones.
+    """
+
+    def __init__(self, path, columns, chunk_size=100000, fmt="npz"):
+        if fmt == "parquet":
+            # imported here, pyarrow is slow to import and only needed for Parquet
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Parquet output requires pyarrow, use fmt='npz'")
+        if fmt not in ["npz", "parquet", "csv"]:
+            raise ValueError("Unknown output format {}".format(fmt))
+
+        self.path = path
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        self.buffers = {name: np.empty(chunk_size, dtype=dtype)
+                        for name, dtype in columns.items()}
+        self.n = 0
+        self.part = 0
+        os.makedirs(path, exist_ok=True)
+        clear_parts(path)
+
+    def append(self, **cols):
+        """Append equally long arrays (or scalars) for every column."""
+        size = max(np.size(c) for c in cols.values())
+        start = 0
+        while start < size:
+            k = min(size - start, self.chunk_size - self.n)
+            for name in self.columns:
+                c = cols[name]
+                self.buffers[name][self.n:self.n+k] = c[start:start+k] if np.ndim(c) else c
+            self.n += k
+            start += k
+            if self.n == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows as the next part file."""
+        if self.n == 0:
+            return
+        data = {name: buf[:self.n].astype(str) if buf.dtype == object else buf[:self.n]
+                for name, buf in self.buffers.items()}
+        fn = os.path.join(self.path, "part-{:05d}.{}".format(self.part, self.fmt))
+
+        if self.fmt == "npz":
+            np.savez_compressed(fn, **data)
+        elif self.fmt == "parquet":
+            import pyarrow.parquet
+            table = pyarrow.table({name: pyarrow.array(c) for name, c in data.items()})
+            pyarrow.parquet.write_table(table, fn)
+        else:
+            with open(fn, "w") as f:
+                f.write(",".join(data) + "\n")
+                rows = zip(*[c.tolist() for c in data.values()])
+                f.writelines(",".join(map(str, row)) + "\n" for row in rows)
+
+        self.part += 1
+        self.n = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_columns(path):
+    """Concatenate the .npz part files under ``path`` into one dict of arrays."""
+    fns = sorted(glob.glob(os.path.join(path, "**", "part-*.npz"), recursive=True))
+    parts = [np.load(fn) for fn in fns]
+    if not parts:
+        return {}
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0].files}
+
+
+class RolloutRecorder(ColumnarWriter):
+    """Per-step, per-vehicle records of evaluation rollouts."""
+
+    def __init__(self, path, chunk_size=100000, fmt="npz"):
+        super().__init__(path, ROLLOUT_COLUMNS, chunk_size, fmt)
+
+    def record(self, env, rollout, t, reward):
+        """Append one row per vehicle currently in the network.
+
+        ``reward`` is either the env reward, or a dict of per-vehicle
+        rewards for multi-agent envs.
+        """
+        snap = env.snapshot.update(env)
+        n = len(snap)
+        if n == 0:
+            return
+        if isinstance(reward, dict):
+            reward = np.array([reward.get(veh_id, 0) for veh_id in snap.ids])
+
+        self.append(rollout=rollout, t=t, veh_id=np.array(snap.ids, dtype=object),
+                    edge=snap.edge, pzone=snap.pzone, lane=snap.lane,
+                    state=snap.state, speed=snap.speed, position=snap.x,
+                    reward=reward)
+
+
+class EmissionWriter(ColumnarWriter):
+    """Per-step vehicle data of the kernel, in place of SUMO's emission XML."""
+
+    def __init__(self, path, chunk_size=100000, fmt="csv"):
+        super().__init__(path, EMISSION_COLUMNS, chunk_size, fmt)
+
+    def record(self, env, rollout, t, reward=None):
+        """Append one row per vehicle currently in the network."""
+        snap = env.snapshot.update(env)
+        if len(snap) == 0:
+            return
+        k = env.k.vehicle
+        ids = snap.ids
+
+        self.append(rollout=rollout, time=env.time_counter * env.sim_step,
+                    id=np.array(ids, dtype=object),
+                    type=np.array(k.get_type(ids), dtype=object),
+                    speed=snap.speed, x=snap.x, edge_id=snap.edge,
+                    lane_number=snap.lane,
+                    relative_position=np.array(k.get_position(ids), dtype=float),
+                    headway=snap.headway, state=snap.state, pzone=snap.pzone)
+
+
+class RecorderGroup:
+    """Passes every record and close call on to several recorders."""
+
+    def __init__(self, *recorders):
+        self.recorders = [r for r in recorders if r is not None]
+
+    def record(self, env, rollout, t, reward):
+        for recorder in self.recorders:
+            recorder.record(env, rollout, t, reward)
+
+    def close(self):
+        for recorder in self.recorders:
+            recorder.close()
+
@@ -0,0 +1,149 @@
+"""Seed derivation and compact episode records for exact replays.
+
+Every episode of a seeded env gets its own seed, derived from the base
+seed, the worker and vector index and the episode number, and seeds the
+simulator and the Python/NumPy generators used by the kernel.  With the
+seed, the actions and the inflow events (time, id, type and target zone of
+every vehicle entering) an episode is a few kB on disk and can be
+re-simulated exactly, instead of keeping its emission output.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+
+def derive_seed(base, *keys):
+    """Independent 31-bit seed for (base, worker, env, episode, ...)."""
+    return int(np.random.SeedSequence([base, *keys]).generate_state(1)[0] >> 1)
+
+
+def seed_env(env, base, worker_index=0, vector_index=0):
+    """Give a curbside env its own episode seed stream."""
+    unwrapped = getattr(env, "unwrapped", env)
+    unwrapped.seed_episodes(base, worker_index, vector_index)
+
+
+def make_seeded_create_env(create_env, seed):
+    """Wrap an env creator so that every RLlib worker and sub-env gets its own seeds."""
+
+    def create_seeded_env(env_config=None):
+        env = create_env(env_config)
+        seed_env(env, seed, getattr(env_config, "worker_index", 0),
+                 getattr(env_config, "vector_index", 0))
+        return env
+
+    return create_seeded_env
+
+
+class EpisodeLog:
+    """Actions and inflow events of one episode."""
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.num_steps = 0
+        self.action_t, self.action_id, self.actions = [], [], []
+        self.event_t, self.event_id, self.event_type, self.event_pzone = [], [], [], []
+        self.known = set()
+
+    def record_action(self, rl_actions):
+        """Store the actions of the next step, an array or a dict of per-agent actions."""
+        t = self.num_steps
+        self.num_steps += 1
+        if rl_actions is None:
+            return
+        items = rl_actions.items() if isinstance(rl_actions, dict) else [("", rl_actions)]
+        for agent_id, action in items:
+            self.action_t.append(t)
+            self.action_id.append(agent_id)
+            self.actions.append(np.ravel(action).astype(np.float32))
+
+    def record_inflow(self, env):
+        """Store the vehicles that entered since the last call."""
+        t = self.num_steps
+        snap = env.snapshot.update(env)
+        for veh_id, pzone in zip(snap.ids, snap.pzone.tolist()):
+            if veh_id not in self.known:
+                self.known.add(veh_id)
+                self.event_t.append(t)
+                self.event_id.append(veh_id)
+                self.event_type.append(env.k.vehicle.get_type(veh_id))
+                self.event_pzone.append(pzone)
+
+    def events(self):
+        return list(zip(self.event_t, self.event_id, self.event_type, self.event_pzone))
+
+    def to_arrays(self):
+        width = max([len(a) for a in self.actions] or [0])
+        actions = np.zeros((len(self.actions), width), dtype=np.float32)
+        for i, a in enumerate(self.actions):
+            actions[i, :len(a)] = a
+        return {"seed": np.int64(self.seed),
+                "num_steps": np.int64(self.num_steps),
+                "action_t": np.array(self.action_t, dtype=np.int32),
+                "action_id": np.array(self.action_id, dtype=str),
+                "actions": actions,
+                "event_t": np.array(self.event_t, dtype=np.int32),
+                "event_id": np.array(self.event_id, dtype=str),
+                "event_type": np.array(self.event_type, dtype=str),
+                "event_pzone": np.array(self.event_pzone, dtype=np.int16)}
+
+
+class ReplayCache:
+    """Directory of episode records, one .npz file per episode seed."""
+
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, seed):
+        return os.path.join(self.root, "episode-{}.npz".format(seed))
+
+    def store(self, log):
+        """Atomically write an episode record, returns its path."""
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **log.to_arrays())
+        os.replace(tmp, self.path(log.seed))
+        return self.path(log.seed)
+
+    def load(self, seed):
+        return load_episode(self.path(seed))
+
+
+def load_episode(path):
+    with np.load(path) as data:
+        return dict(data)
+
+
+def episode_actions(record, t):
+    """Actions of step t, in the form the env took them (array, dict or None)."""
+    rows = np.flatnonzero(record["action_t"] == t)
+    if len(rows) == 0:
+        return None
+    ids = record["action_id"][rows]
+    if len(rows) == 1 and ids[0] == "":
+        return record["actions"][rows[0]]
+    return {str(i): record["actions"][r] for i, r in zip(ids, rows)}
+
+
+def replay_episode(env, record, recorder=None, rollout=0):
+    """Re-simulate a recorded episode and return the diverging inflow events."""
+    unwrapped = env.unwrapped
+    unwrapped.replay_seed = int(record["seed"])
+    try:
+        env.reset()
+    finally:
+        unwrapped.replay_seed = None
+
+    for t in range(int(record["num_steps"])):
+        _, reward, _, _ = env.step(episode_actions(record, t))
+        if recorder is not None:
+            recorder.record(unwrapped, rollout, t, reward)
+
+    recorded = list(zip(record["event_t"].tolist(), record["event_id"].tolist(),
+                        record["event_type"].tolist(), record["event_pzone"].tolist()))
+    replayed = unwrapped.episode_log.events()
+    return [(a, b) for a, b in zip(recorded, replayed) if a != b] \
+        + [(a, None) for a in recorded[len(replayed):]] \
+        + [(None, b) for b in replayed[len(recorded):]]
@@ -2,6 +2,12 @@ from flow.networks.base import Network
 from flow.core.params import InitialConfig
 from flow.core.params import TrafficLightParams
 from numpy import pi, sin, cos
+from copy import deepcopy
+import numpy as np
+
+from curbside_geometry import CorridorGeometry
+from curbside_grid import GridSpec, edge_types
+from curbside_netcache import NetworkCache, network_key
 
 INFLOW_EDGE_LEN = 200  # length of the inflow edges (needed for resets)
 VEHICLE_LENGTH = 5
@@ -28,9 +34,42 @@ class curbsideNetworkPZones(Network):
         for p in ADDITIONAL_NET_PARAMS.keys():
             if p not in net_params.additional_params:
                 raise KeyError('Network parameter "{}" not supplied'.format(p))
-
-        super().__init__(name, vehicles, net_params, initial_config,
-                         traffic_lights)
+        if net_params.additional_params.get("curb_spots", False):
+            # SUMO vehicles stop at their zone, not at a spot position
+            raise ValueError('Network parameter "curb_spots" is only supported '
+                             'by the NumPy backend (curbside_fastsim)')
+
+        self.geometry = CorridorGeometry(net_params.additional_params)
+
+        # optionally load a cached .net.xml instead of regenerating the network
+        self.net_cache = None
+        self.net_cache_key = None
+        cache_dir = net_params.additional_params.get("net_cache")
+        if cache_dir is not None:
+            self.net_cache = NetworkCache(cache_dir)
+            self.net_cache_key = network_key(net_params.additional_params, vehicles)
+            template = self.net_cache.lookup(self.net_cache_key) \
+                or self.net_cache.acquire(self.net_cache_key)
+            if template is not None:
+                net_params = deepcopy(net_params)
+                net_params.template = template
+
+        try:
+            super().__init__(name, vehicles, net_params, initial_config,
+                             traffic_lights)
+        except BaseException:
+            self.release_net_cache()
+            raise
+
+    def store_net_cache(self, net_file):
+        """Store the network generated by the kernel if this process built it."""
+        if self.net_cache is not None and self.net_cache.building:
+            self.net_cache.store(self.net_cache_key, net_file)
+
+    def release_net_cache(self):
+        """Let the other workers build the network, if this process holds the lock."""
+        if self.net_cache is not None:
+            self.net_cache.release()
 
     def specify_nodes(self, net_params):
         """See parent class."""
@@ -91,18 +130,7 @@ class curbsideNetworkPZones(Network):
         lanes = net_params.additional_params["lanes"]
         speed = net_params.additional_params["speed_limit"]
 
-        types = [{
-            "id": "curbType",
-            "numLanes": lanes,
-            "speed": speed
-        },
-        {
-            "id": "circulatorType",
-            "numLanes": lanes -1,
-            "speed": speed,
-        }]
-
-        return types
+        return edge_types(lanes, speed)
 
     def specify_routes(self, net_params):
         """See parent class."""
@@ -119,12 +147,7 @@ class curbsideNetworkPZones(Network):
 
     def specify_edge_starts(self,):
         """See parent class."""
-        L_p = self.net_params.additional_params["length_parking"]
-        L_i = self.net_params.additional_params["length_inflow"]
-        L_o = self.net_params.additional_params["length_outflow"]
-        N_p = self.net_params.additional_params["number_parking_zones"]
-
-        edgestarts = [("inflow", 0)] +[(f"parking_{i}", L_i+i*L_p/N_p) for i in range(N_p)]+[("outflow",L_p+L_i)]
+        edgestarts = list(zip(self.geometry.edges, self.geometry.edge_starts.tolist()))
 
         return edgestarts
 
@@ -146,3 +169,45 @@ class curbsideNetworkPZones(Network):
             }
 
         return conn_dic
+
+
+class curbsideGridNetwork(Network):
+    """Multi-block corridor or street grid with curb parking.
+
+    The specs come from curbside_grid.GridSpec, see GRID_NET_PARAMS for
+    the network parameters.  Vehicles enter on ``spec.entry_edges``, which
+    are the only edges with routes, and park on the curb lane of
+    ``spec.curb_edges``.
+    """
+
+    def __init__(self,
+                 name,
+                 vehicles,
+                 net_params,
+                 initial_config=InitialConfig(),
+                 traffic_lights=TrafficLightParams()):
+        """Initialize a grid scenario."""
+        self.spec = GridSpec(net_params.additional_params)
+
+        super().__init__(name, vehicles, net_params, initial_config,
+                         traffic_lights)
+
+    def specify_nodes(self, net_params):
+        """See parent class."""
+        return self.spec.nodes
+
+    def specify_edges(self, net_params):
+        """See parent class."""
+        return self.spec.edges
+
+    def specify_types(self, net_params):
+        """See parent class."""
+        return edge_types(self.spec.params["lanes"], self.spec.params["speed_limit"])
+
+    def specify_routes(self, net_params):
+        """See parent class."""
+        return self.spec.routes
+
+    def specify_connections(self, net_params):
+        """See parent class."""
+        return self.spec.connections
@@ -0,0 +1,114 @@
+import numpy as np
+
+from curbside_dynamics import lane_neighbors
+from curbside_state import state_translation
+
+
+def sim_time(env):
+    """Number of simulation steps reflected in the kernel state of env."""
+    return getattr(env, "sim_time", env.time_counter)
+
+
+class VehicleSnapshot:
+    """Per-step copy of the vehicle fields read by the curbside envs.
+
+    Every field is pulled from the kernel once per simulation step for all
+    vehicles and stored in NumPy arrays indexed by vehicle slot, so that
+    observations and rewards can be computed with array operations instead
+    of one kernel call per vehicle per field.
+
+    Leaders and followers come from a single sort of all vehicles by
+    (corridor lane, position), and are shared by the observations and the
+    fleet-level controllers.  The snapshot is keyed on the simulated time,
+    so the one read after a simulation step also serves the controllers of
+    the next step.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drop the cached step so that the next update re-reads the kernel."""
+        self.time = None
+        self.ids = []
+        self.slot = {}
+        self.rl_slots = np.zeros(0, dtype=int)
+
+        self.edge = np.zeros(0, dtype=object)
+        self.edge_zone = np.zeros(0, dtype=int)
+        self.lane = np.zeros(0, dtype=int)
+        self.corridor_lane = np.zeros(0, dtype=int)
+        self.pzone = np.zeros(0, dtype=int)
+        self.state = np.zeros(0, dtype=np.int8)
+        self.speed = np.zeros(0)
+        self.length = np.zeros(0)
+        self.x = np.zeros(0)
+        self.dist = np.zeros(0)
+        self.leader = np.zeros(0, dtype=int)
+        self.follower = np.zeros(0, dtype=int)
+        self.headway = np.zeros(0)
+        self.follow_head = np.zeros(0)
+        self.rel_speed = np.zeros(0)
+        self.lead_speed = np.zeros(0)
+        self.lead_head = np.zeros(0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, env):
+        """Refresh the snapshot if the simulation has advanced since the last call."""
+        time = sim_time(env)
+        if self.time == time:
+            return self
+
+        k = env.k.vehicle
+        ids = list(k.get_ids())
+        n = len(ids)
+
+        self.time = time
+        self.ids = ids
+        self.slot = {veh_id: i for i, veh_id in enumerate(ids)}
+        self.rl_slots = np.array([self.slot[i] for i in k.get_rl_ids()
+                                  if i in self.slot], dtype=int)
+
+        max_speed = env.k.network.max_speed()*3
+        max_length = env.k.network.length()
+
+        edges = k.get_edge(ids)
+        self.edge = np.array(edges, dtype=object)
+        self.edge_zone = env.network.geometry.zones(edges)
+        self.lane = np.array(k.get_lane(ids), dtype=int)
+        self.speed = np.array(k.get_speed(ids), dtype=float)
+        self.length = np.array(k.get_length(ids), dtype=float)
+
+        # the curbside kernel methods below only accept a single id
+        self.pzone = np.array([k.get_pzone(i, env) for i in ids], dtype=int)
+        self.state = np.array([state_translation.get(k.get_state(i), -1)
+                               for i in ids], dtype=np.int8)
+        self.x = np.array([k.get_global_position(i, env) for i in ids], dtype=float)
+        self.dist = np.array([k.get_distance_to_pzone(i, env) for i in ids],
+                             dtype=float)
+
+        # one sort per step gives leaders and followers of all vehicles
+        self.corridor_lane = env.network.geometry.corridor_lanes(self.x, self.lane)
+        self.leader, self.follower = lane_neighbors(self.x, self.corridor_lane)
+        has_lead = self.leader >= 0
+        has_follow = self.follower >= 0
+        lead, follow = self.leader[has_lead], self.follower[has_follow]
+
+        self.headway = np.full(n, np.inf)
+        self.headway[has_lead] = self.x[lead] - self.length[lead] - self.x[has_lead]
+        self.follow_head = np.full(n, np.inf)
+        self.follow_head[has_follow] = self.x[has_follow] - self.length[has_follow] \
+            - self.x[follow]
+        self.rel_speed = np.zeros(n)
+        self.rel_speed[has_lead] = self.speed[lead] - self.speed[has_lead]
+
+        # leader speed and headway, with the "not visible" defaults used by
+        # the observation when there is no leader
+        self.lead_speed = np.full(n, max_speed, dtype=float)
+        self.lead_head = np.full(n, max_length, dtype=float)
+        self.lead_speed[has_lead] = self.speed[lead]
+        self.lead_head[has_lead] = self.headway[has_lead]
+
+        return self
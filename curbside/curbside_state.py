@@ -0,0 +1,124 @@
+"""Parking lifecycle of curbside vehicles.
+
+Every vehicle goes through inflow -> parking -> parked -> outflow ("slowing"
+is kept as a code but no longer entered).  States are stored as int8 codes
+and advanced for all vehicles at once, exactly once per simulation step.
+"""
+import numpy as np
+
+state_translation = {"inflow":0,"slowing":1,"parking":2,"parked":3, "outflow":4}
+STATE_NAMES = sorted(state_translation, key=state_translation.get)
+
+INFLOW, SLOWING, PARKING, PARKED, OUTFLOW = range(5)
+
+
+def advance_states(state, zone, pzone, v, t_elapsed, t_total, dt):
+    """One transition of the lifecycle for arrays of vehicles.
+
+    ``zone`` is the parking zone the vehicle is on (-1 off the parking
+    section) and ``pzone`` its target zone.  Parking timers of parked
+    vehicles are advanced in place by ``dt``.  Returns the new state codes.
+    """
+    new = state.copy()
+
+    inflow = state == INFLOW
+    new[inflow & ((pzone == 0) | (zone == pzone - 1))] = PARKING
+
+    parking = state == PARKING
+    new[parking & (zone == pzone) & (v < 1e-3)] = PARKED
+
+    parked = state == PARKED
+    t_elapsed[parked] += dt
+    # just for now, total parking times are scaled down by 10
+    leave = parked & (t_elapsed >= t_total / 10)
+    new[parked & ~leave & (v > 1e-3)] = PARKING
+    new[leave] = OUTFLOW
+
+    return new
+
+
+class ParkingStateMachine:
+    """Lifecycle state and parking timer of every vehicle in the network.
+
+    The first consumer in a simulation step calls ``advance``, which reads
+    edge, speed and target zone of all vehicles, applies one vectorized
+    transition and writes changed states back to the kernel with
+    ``set_state``.  ``update_tpark_elapsed`` is called for every vehicle on
+    every step, as curbsideLaneChangeController.update_state does, so the
+    kernel keeps its own parking timers.  Controllers only read from it.
+    """
+
+    __slots__ = ["sim_step", "time", "ids", "index", "state", "t_elapsed", "t_total",
+                 "preset_total"]
+
+    def __init__(self, sim_step):
+        self.sim_step = sim_step
+        self.clear()
+
+    def clear(self):
+        self.time = None
+        self.ids = []
+        self.index = {}
+        self.state = np.zeros(0, dtype=np.int8)
+        self.t_elapsed = np.zeros(0)
+        self.t_total = np.zeros(0)
+        # parking durations assigned before the vehicles entered, by id
+        self.preset_total = {}
+
+    def _sync(self, env, ids):
+        """Carry over known vehicles and register the ones that entered."""
+        k = env.k.vehicle
+        old = [self.index.get(veh_id, -1) for veh_id in ids]
+        known = np.array([i >= 0 for i in old], dtype=bool)
+        old = np.array(old, dtype=int)
+
+        state = np.zeros(len(ids), dtype=np.int8)
+        t_elapsed = np.zeros(len(ids))
+        t_total = np.zeros(len(ids))
+        state[known] = self.state[old[known]]
+        t_elapsed[known] = self.t_elapsed[old[known]]
+        t_total[known] = self.t_total[old[known]]
+
+        for j in np.flatnonzero(~known):
+            state[j] = state_translation.get(k.get_state(ids[j]), INFLOW)
+            t_total[j] = self.preset_total.pop(ids[j], None) \
+                or k.get_tparking_total(ids[j], env)
+
+        self.ids = ids
+        self.index = {veh_id: i for i, veh_id in enumerate(ids)}
+        self.state, self.t_elapsed, self.t_total = state, t_elapsed, t_total
+
+    def advance(self, env):
+        """Advance all vehicles by one step, if not already done this step."""
+        if self.time == env.time_counter:
+            return self
+        self.time = env.time_counter
+
+        k = env.k.vehicle
+        ids = list(k.get_ids())
+        if ids != self.ids:
+            self._sync(env, ids)
+        if not ids:
+            return self
+
+        zone = env.network.geometry.zones(k.get_edge(ids))
+        v = np.array(k.get_speed(ids), dtype=float)
+        pzone = np.array([k.get_pzone(i, env) for i in ids], dtype=int)
+
+        for veh_id in ids:
+            k.update_tpark_elapsed(veh_id)
+        new = advance_states(self.state, zone, pzone, v, self.t_elapsed,
+                             self.t_total, self.sim_step)
+        for j in np.flatnonzero(new != self.state):
+            k.set_state(ids[j], STATE_NAMES[new[j]])
+        self.state = new
+        return self
+
+    def code(self, veh_id):
+        return int(self.state[self.index[veh_id]])
+
+    def get(self, veh_id):
+        return STATE_NAMES[self.state[self.index[veh_id]]]
+
+    def get_tparking_elapsed(self, veh_id):
+        return float(self.t_elapsed[self.index[veh_id]])
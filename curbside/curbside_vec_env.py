@@ -0,0 +1,72 @@
+import functools
+
+import numpy as np
+
+from curbside_replay import seed_env
+
+
+class CurbsideVectorEnv:
+    """Step K independent curbside corridors in lockstep inside one worker.
+
+    Observations, rewards and dones are returned as stacked arrays of shape
+    (K, obs_dim), (K,) and (K,).  RLlib uses the object directly as the
+    worker's vector env (see rllib_vector_env), so ``num_envs_per_worker``
+    should be set to K.
+    """
+
+    def __init__(self, make_env, num_envs, seed=None, worker_index=0):
+        self.envs = [make_env(i) for i in range(num_envs)]
+        self.num_envs = num_envs
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.last_obs = [None] * num_envs
+
+        if seed is not None:
+            # own episode seeds for every worker and corridor
+            for i, env in enumerate(self.envs):
+                seed_env(env, seed, worker_index, i)
+
+    def vector_reset(self):
+        self.dones[:] = False
+        self.last_obs = [np.asarray(env.reset(), dtype=np.float32) for env in self.envs]
+        return np.stack(self.last_obs)
+
+    def reset_at(self, index):
+        self.dones[index] = False
+        self.last_obs[index] = np.asarray(self.envs[index].reset(), dtype=np.float32)
+        return self.last_obs[index]
+
+    def vector_step(self, actions):
+        rewards = np.zeros(self.num_envs)
+        infos = [{} for _ in range(self.num_envs)]
+
+        for i, env in enumerate(self.envs):
+            # finished corridors wait for reset_at, as RLlib expects
+            if self.dones[i]:
+                continue
+            obs, rewards[i], self.dones[i], infos[i] = env.step(actions[i])
+            self.last_obs[i] = np.asarray(obs, dtype=np.float32)
+
+        return np.stack(self.last_obs), rewards, self.dones.copy(), infos
+
+    def get_unwrapped(self):
+        return self.envs
+
+
+@functools.lru_cache(maxsize=None)
+def rllib_vector_env():
+    """CurbsideVectorEnv as an RLlib VectorEnv, created on first use to defer the ray import."""
+    from ray.rllib.env.vector_env import VectorEnv
+
+    return type("CurbsideVectorEnv", (CurbsideVectorEnv, VectorEnv), {})
+
+
+def make_create_vector_env(create_env, num_envs, seed=None):
+    """Wrap a single-env creator so that it builds a CurbsideVectorEnv."""
+
+    def create_vector_env(env_config=None):
+        return rllib_vector_env()(lambda i: create_env(env_config), num_envs, seed,
+                                  getattr(env_config, "worker_index", 0))
+
+    return create_vector_env
@@ -0,0 +1,412 @@
+"""Throughput benchmarks for the curbside environments.
+
+Attributes
+----------
+EXAMPLE_USAGE : str
+    Example call to the function, which is
+    ::
+
+        python ./benchmark.py --suite env kernels --save baseline.json
+
+parser : ArgumentParser
+    Command-line argument parser
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+EXAMPLE_USAGE = """
+example usage:
+    python ./benchmark.py --suite env --simulator fast --save baseline.json
+    python ./benchmark.py --suite env kernels --compare baseline.json
+    python ./benchmark.py --suite ppo --ncpu 2 --iterations 3
+    python ./benchmark.py --suite imports --compare baseline.json
+    python ./benchmark.py --suite network
+
+Results are written as JSON, {"meta": ..., "results": {name: {"value",
+"unit", "higher_is_better"}}}.  With --compare, every result that is worse
+than the baseline by more than --tolerance is reported and the script exits
+with status 1.
+"""
+
+GRID = {
+    "number_parking_zones": [5, 20],
+    "num_rl": [1, 5],
+    "num_humans": [10, 50],
+    "horizon": [200, 1000],
+}
+
+# modules timed by the import benchmark, each in a fresh interpreter
+IMPORT_MODULES = [
+    "curbside_dynamics", "curbside_state", "curbside_observation",
+    "curbside_recorder", "curbside_replay", "curbside_policy",
+    "curbside_controllers", "curbside_geometry", "curbside_scenario",
+    "curbside_env", "curbside_multiagent_env", "curbside_fastsim",
+    "curbside_vec_env",
+]
+
+# entry points timed with --help
+ENTRY_POINTS = ["train.py", "visualizer_rllib.py", "export_policy.py"]
+
+QUICK_GRID = {
+    "number_parking_zones": [5],
+    "num_rl": [1],
+    "num_humans": [10],
+    "horizon": [200],
+}
+
+
+def result(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_env(env_name, simulator, grid, seed):
+    """Env steps per second over the parameter grid."""
+    from train import get_flow_params
+    from curbside_fastsim import make_create_fast_env
+    import curbside_env
+
+    results = {}
+    keys = sorted(grid)
+    for values in itertools.product(*[grid[k] for k in keys]):
+        p = dict(zip(keys, values))
+        num_rl = p["num_rl"]
+        flow_params = get_flow_params(
+            p["horizon"], num_humans=p["num_humans"], num_rl=num_rl,
+            env_name=getattr(curbside_env, env_name), seed=seed,
+            additional_net_params={"number_parking_zones": p["number_parking_zones"]},
+            additional_env_params={"num_rl": num_rl})
+
+        if simulator == "fast":
+            create_env, _ = make_create_fast_env(flow_params)
+        else:
+            from flow.utils.registry import make_create_env
+            create_env, _ = make_create_env(flow_params)
+        env = create_env()
+
+        space = env.action_space
+        rng = np.random.default_rng(seed)
+        actions = rng.uniform(space.low, space.high, (p["horizon"], ) + space.shape)
+
+        t = time.perf_counter()
+        env.reset()
+        t_reset = time.perf_counter() - t
+
+        t = time.perf_counter()
+        steps = 0
+        for a in actions:
+            _, _, done, _ = env.step(a)
+            steps += 1
+            if done:
+                break
+        elapsed = time.perf_counter() - t
+
+        env.terminate()
+
+        name = "env/{}/{}/".format(env_name, simulator) + "/".join(
+            "{}={}".format(k, p[k]) for k in keys)
+        results[name + "/steps_per_sec"] = result(steps / elapsed, "steps/s")
+        results[name + "/reset"] = result(t_reset, "s", higher_is_better=False)
+        print("{}: {:.1f} steps/s, reset {:.3f} s".format(name, steps / elapsed, t_reset))
+
+    return results
+
+
+def bench_kernels(sizes, repeat, seed):
+    """Vectorized dynamics, state machine and occupancy functions in isolation.
+
+    These are the array kernels behind the controllers; the controller
+    classes are timed within env steps by the profiler (env param
+    ``profile``, see curbside_profiling).
+    """
+    from curbside_dynamics import idm_accel, park_accel
+    from curbside_occupancy import ParkingOccupancy, assign_free_zones
+    from curbside_state import advance_states
+
+    rng = np.random.default_rng(seed)
+    idm = (30, 1, 1, 1.5, 4, 2)
+    results = {}
+
+    def timeit(name, fn):
+        t = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        per_call = (time.perf_counter() - t) / repeat
+        results[name] = result(per_call, "s", higher_is_better=False)
+        print("{}: {:.2f} us/call".format(name, per_call * 1e6))
+
+    for n in sizes:
+        v = rng.uniform(0, 10, n)
+        lead_v = rng.uniform(0, 10, n)
+        h = rng.uniform(1, 50, n)
+        has_lead = rng.random(n) < 0.9
+        l = rng.uniform(-10, 200, n)
+        a_idm = idm_accel(v, lead_v, h, has_lead, *idm)
+
+        state = rng.integers(0, 5, n).astype(np.int8)
+        zone = rng.integers(-1, 5, n)
+        pzone = rng.integers(0, 5, n)
+        t_elapsed = np.zeros(n)
+        t_total = rng.uniform(60, 600, n)
+
+        timeit("kernels/idm_accel/n={}".format(n),
+               lambda: idm_accel(v, lead_v, h, has_lead, *idm))
+        timeit("kernels/park_accel/n={}".format(n),
+               lambda: park_accel(a_idm, v, l, 200, *idm))
+        timeit("kernels/advance_states/n={}".format(n),
+               # advance_states advances the timers in place
+               lambda: advance_states(state, zone, pzone, v, t_elapsed.copy(), t_total, 0.2))
+
+        # n vehicles searching a corridor of n zones, a third of them free
+        lo = rng.integers(0, n, n)
+        hi = np.minimum(lo + 5, n - 1)
+        target = np.minimum(lo + 2, hi)
+        free = rng.random(n) < 1/3
+        timeit("kernels/assign_free_zones/n={}".format(n),
+               lambda: assign_free_zones(target, lo, hi, free, -l))
+
+    occupancy = ParkingOccupancy(50)
+    occupancy.count = (rng.random(50) < 0.8).astype(int)
+    timeit("kernels/occupancy_nearest_free",
+           lambda: occupancy.nearest_free(25, 4, lo=20, hi=31))
+
+    return results
+
+
+def _interpreter_time(argv, repeat):
+    """Best wall time of a fresh interpreter running argv, None if it fails."""
+    here = os.path.dirname(os.path.realpath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [here, os.path.join(here, "..", "curbside"), env.get("PYTHONPATH", "")])
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        proc = subprocess.run([sys.executable] + argv, cwd=here, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        times.append(time.perf_counter() - t)
+        if proc.returncode != 0:
+            error = (proc.stderr.decode().strip().splitlines() or [""])[-1]
+            print("{}: failed, {}".format(" ".join(argv), error))
+            return None
+    return min(times)
+
+
+def bench_imports(repeat):
+    """Startup time of the curbside modules and of the entry points' --help."""
+    results = {}
+    baseline = _interpreter_time(["-c", "pass"], repeat)
+    print("imports/python: {:.3f} s".format(baseline))
+    for module in IMPORT_MODULES:
+        elapsed = _interpreter_time(["-c", "import " + module], repeat)
+        if elapsed is not None:
+            results["imports/" + module] = result(elapsed - baseline, "s",
+                                                  higher_is_better=False)
+            print("imports/{}: {:.3f} s".format(module, elapsed - baseline))
+    for script in ENTRY_POINTS:
+        elapsed = _interpreter_time([script, "--help"], repeat)
+        if elapsed is not None:
+            results["imports/{}/help".format(script)] = result(
+                elapsed - baseline, "s", higher_is_better=False)
+            print("imports/{} --help: {:.3f} s".format(script, elapsed - baseline))
+    return results
+
+
+def _read_spec(spec):
+    """Read the specs the way flow's network kernel does, returns the item count."""
+    routes = {edge: [(route, 1)] for edge, route in spec.routes.items()}
+    count = len(spec.nodes) + len(spec.edges)
+    count += sum(len(conns) for conns in spec.connections.values())
+    count += sum(len(r) for choices in routes.values() for r, _ in choices)
+    return count
+
+
+def bench_network(sizes, repeat):
+    """Spec generation and reading time of square street grids, per edge."""
+    from curbside_grid import GridSpec
+
+    results = {}
+    for n in sizes:
+        params = {"rows": n, "blocks": n, "curb": "all"}
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            spec = GridSpec(params)
+            _read_spec(spec)
+            times.append(time.perf_counter() - t)
+        per_edge = min(times) / len(spec.edges)
+        name = "network/grid/n={}".format(n)
+        results[name + "/time_per_edge"] = result(per_edge, "s", higher_is_better=False)
+        print("{}: {} edges in {:.3f} s, {:.2f} us/edge".format(
+            name, len(spec.edges), min(times), per_edge * 1e6))
+    return results
+
+
+def bench_ppo(ncpu, iterations, horizon, n_rollouts, simulator, seed):
+    """Wall time of PPO training iterations with the train.py config."""
+    import ray
+    from train import get_flow_params, get_ppo_config, register_curbside_env
+
+    flow_params = get_flow_params(horizon, seed=seed)
+    ray.init(num_cpus=ncpu)
+    _, agent_cls, config = get_ppo_config(flow_params, ncpu, n_rollouts)
+    gym_name = register_curbside_env(flow_params, simulator)
+    agent = agent_cls(env=gym_name, config=config)
+
+    times = []
+    for i in range(iterations):
+        t = time.perf_counter()
+        agent.train()
+        times.append(time.perf_counter() - t)
+        print("ppo iteration {}: {:.2f} s".format(i, times[-1]))
+    ray.shutdown()
+
+    name = "ppo/{}/ncpu={}/horizon={}/rollouts={}".format(simulator, ncpu, horizon, n_rollouts)
+    # the first iteration includes worker startup
+    return {name + "/first_iteration": result(times[0], "s", higher_is_better=False),
+            name + "/iteration": result(float(np.mean(times[1:] or times)), "s",
+                                        higher_is_better=False)}
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against a baseline and return the regressed names."""
+    regressions = []
+    print("\n{:<90} {:>12} {:>12} {:>8}".format("benchmark", "baseline", "current", "ratio"))
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], results[name]["value"]
+        ratio = new / old if old else float("inf")
+        worse = ratio < 1 - tolerance if results[name]["higher_is_better"] \
+            else ratio > 1 + tolerance
+        if worse:
+            regressions.append(name)
+        print("{:<90} {:>12.4g} {:>12.4g} {:>8.3f}{}".format(
+            name, old, new, ratio, "  REGRESSION" if worse else ""))
+    return regressions
+
+
+def main(args):
+    grid = QUICK_GRID if args.quick else GRID
+    results = {}
+
+    if "env" in args.suite:
+        for env_name in args.envs:
+            for simulator in args.simulator:
+                results.update(bench_env(env_name, simulator, grid, args.seed))
+    if "kernels" in args.suite:
+        results.update(bench_kernels([10, 100, 1000], args.repeat, args.seed))
+    if "network" in args.suite:
+        results.update(bench_network([10, 30, 100], 3))
+    if "imports" in args.suite:
+        results.update(bench_imports(args.import_repeat))
+    if "ppo" in args.suite:
+        for simulator in args.simulator:
+            results.update(bench_ppo(args.ncpu, args.iterations, args.horizon,
+                                     args.n_rollouts, simulator, args.seed))
+
+    if args.save:
+        meta = {"python": sys.version, "platform": platform.platform(),
+                "numpy": np.__version__, "seed": args.seed, "time": time.time()}
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+def create_parser():
+    """Create the parser to capture CLI arguments."""
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='[Flow] Benchmarks curbside environment throughput.',
+        epilog=EXAMPLE_USAGE)
+
+    parser.add_argument(
+        '--suite',
+        nargs='+',
+        default=['env', 'kernels'],
+        choices=['env', 'kernels', 'imports', 'network', 'ppo'],
+        help='Benchmarks to run')
+    parser.add_argument(
+        '--envs',
+        nargs='+',
+        default=['CurbsideSoloEnv', 'CurbsideTrafficEnv'],
+        help='Environment classes for the env benchmark')
+    parser.add_argument(
+        '--simulator',
+        nargs='+',
+        default=['sumo'],
+        choices=['sumo', 'fast'],
+        help='Simulation backends to benchmark')
+    parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='Only run the smallest point of the parameter grid')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=10,
+        help='Seed for the simulation, actions and PPO')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1000,
+        help='Calls per array kernel in the kernels suite')
+    parser.add_argument(
+        '--import_repeat',
+        type=int,
+        default=5,
+        help='Fresh interpreters per import benchmark, the fastest counts')
+    parser.add_argument(
+        '--ncpu',
+        type=int,
+        default=2,
+        help='Number of cpus for the PPO benchmark')
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=3,
+        help='Number of PPO training iterations to time')
+    parser.add_argument(
+        '--horizon',
+        type=int,
+        default=200,
+        help='Horizon of the PPO benchmark')
+    parser.add_argument(
+        '--n_rollouts',
+        type=int,
+        default=4,
+        help='Rollouts per PPO training iteration')
+    parser.add_argument(
+        '--save',
+        type=str,
+        help='Write the results to this JSON file')
+    parser.add_argument(
+        '--compare',
+        type=str,
+        help='Baseline JSON file to compare the results against')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.1,
+        help='Relative change counted as a regression in --compare')
+    return parser
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,129 @@
+"""Export the policy of an rllib checkpoint for the NumPy runtime.
+
+Attributes
+----------
+EXAMPLE_USAGE : str
+    Example call to the function, which is
+    ::
+
+        python ./export_policy.py /tmp/ray/result_dir 1
+
+parser : ArgumentParser
+    Command-line argument parser
+"""
+
+import argparse
+import os
+
+from curbside_policy import NumpyPolicy, extract_policy, save_policy
+from visualizer_rllib import _get_agent_class, _local_worker
+
+
+EXAMPLE_USAGE = """
+example usage:
+    python ./export_policy.py /ray_results/experiment_dir/result_dir 1
+
+Here the arguments are:
+1 - the path to the simulation results
+2 - the number of the checkpoint
+
+The policy is written to <result_dir>/policy-<checkpoint_num>.npz unless
+--output is given, and can then be evaluated without Ray:
+
+    from curbside_policy import NumpyPolicy
+    actions = NumpyPolicy("policy-1.npz").compute_actions(obs_batch)
+"""
+
+
+def restore_agent(result_dir, checkpoint_num, run=None):
+    """Trainer of a result directory, restored from one of its checkpoints."""
+    from ray.tune.registry import register_env
+    from flow.utils.registry import make_create_env
+    from flow.utils.rllib import get_flow_params
+    from flow.utils.rllib import get_rllib_config
+    from flow.utils.rllib import get_rllib_pkl
+
+    config = get_rllib_config(result_dir)
+    if config.get('multiagent', {}).get('policies', None):
+        config['multiagent'] = get_rllib_pkl(result_dir)['multiagent']
+    config['num_workers'] = 0
+
+    flow_params = get_flow_params(config)
+    create_env, env_name = make_create_env(params=flow_params, version=0)
+    register_env(env_name, create_env)
+
+    agent_cls = _get_agent_class(run or config['env_config']['run'])
+    agent = agent_cls(env=env_name, config=config)
+    checkpoint = result_dir + '/checkpoint_' + checkpoint_num
+    checkpoint = checkpoint + '/checkpoint-' + checkpoint_num
+    agent.restore(checkpoint)
+    return agent, config
+
+
+def export_policy(agent, config, path, policy_id=None):
+    """Write the weights, filter and action bounds of one policy to path."""
+    worker = _local_worker(agent)
+    if policy_id is None:
+        if len(worker.policy_map) != 1:
+            raise ValueError("Pick one of the policies {} with --policy_id".format(
+                sorted(worker.policy_map)))
+        policy_id = next(iter(worker.policy_map))
+
+    policy = worker.policy_map[policy_id]
+    arrays = extract_policy(policy.get_weights(), worker.filters[policy_id],
+                            policy.action_space,
+                            config['model'].get('fcnet_activation', 'tanh'))
+    save_policy(path, arrays)
+    return policy_id
+
+
+def main(args):
+    import ray
+
+    result_dir = args.result_dir.rstrip('/')
+    output = args.output or os.path.join(
+        result_dir, 'policy-{}.npz'.format(args.checkpoint_num))
+
+    ray.init(num_cpus=1)
+    agent, config = restore_agent(result_dir, args.checkpoint_num, args.run)
+    policy_id = export_policy(agent, config, output, args.policy_id)
+    ray.shutdown()
+
+    policy = NumpyPolicy(output)
+    print('Exported policy {} to {}'.format(policy_id, output))
+    print('Layers: {}'.format(' -> '.join(
+        [str(policy.obs_dim)] + [str(W.shape[1]) for W in policy.weights])))
+    print('Observation filter: {}'.format(
+        'none' if policy.mean is None else 'mean/std'))
+
+
+def create_parser():
+    """Create the parser to capture CLI arguments."""
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='[Flow] Exports a trained policy to a NumPy .npz file.',
+        epilog=EXAMPLE_USAGE)
+
+    parser.add_argument(
+        'result_dir', type=str, help='Directory containing results')
+    parser.add_argument('checkpoint_num', type=str, help='Checkpoint number.')
+    parser.add_argument(
+        '--run',
+        type=str,
+        help='The algorithm used to train the results, if it is not stored '
+             'in params.json.')
+    parser.add_argument(
+        '--policy_id',
+        type=str,
+        help='Policy to export for multiagent results.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        help='Path of the exported .npz file.')
+    return parser
+
+
+if __name__ == '__main__':
+    parser = create_parser()
+    args = parser.parse_args()
+    main(args)
@@ -1,32 +1,35 @@
-# FLow imports
-from flow.core.params import VehicleParams
-from flow.controllers import IDMController
-from flow.core.params import SumoCarFollowingParams
-from flow.core.params import InFlows
-from flow.core.params import NetParams
-from flow.core.params import SumoParams, EnvParams, InitialConfig
-from flow.core.experiment import Experiment
-
-# custom imports
-from curbside_scenario import curbsideNetworkPZones as curbsideNetwork, ADDITIONAL_NET_PARAMS
-from curbside_controllers import curbsideAccelController, curbsideLaneChangeController, curbsideRouter
-from curbside_env import CurbsideEnv, ADDITIONAL_ENV_PARAMS
-
-from flow.controllers import RLController
+"""Training of the curbside envs with RLlib PPO.
 
+Ray, RLlib, flow and the curbside envs are imported by the functions that
+use them: --help returns without loading any of them, and --dry_run checks
+the experiment config without importing Ray (except with --multiagent,
+flow's MultiEnv imports ray.rllib).
+"""
+import argparse
 import json
 
-import ray
-from ray.tune import run_experiments
-from ray.tune.registry import register_env
+EXAMPLE_USAGE = """
+example usage:
+    python train.py --ncpu 4 --horizon 1000
+    python train.py --ncpu 4 --horizon 1000 --simulator fast
+    python train.py --ncpu 4 --horizon 1000 --multiagent
+    python train.py --horizon 1000 --inflow poisson --dry_run
+"""
 
-from flow.utils.registry import make_create_env
-from flow.utils.rllib import FlowParamsEncoder
-from ray.rllib.agents.registry import get_agent_class
 
-import argparse
+def get_flow_params(horizon, num_humans=10, num_rl=1, env_name=None,
+                    additional_net_params=None, additional_env_params=None, seed=10):
+    """Build the flow_params of a curbside experiment."""
+    from flow.controllers import RLController
+    from flow.core.params import VehicleParams
+    from flow.core.params import SumoCarFollowingParams
+    from flow.core.params import NetParams
+    from flow.core.params import SumoParams, EnvParams, InitialConfig
+
+    from curbside_scenario import curbsideNetworkPZones as curbsideNetwork, ADDITIONAL_NET_PARAMS
+    from curbside_controllers import curbsideAccelController, curbsideLaneChangeController, curbsideRouter
+    from curbside_env import CurbsideTrafficEnv, ADDITIONAL_ENV_PARAMS
 
-def main(args):
     # Setup vehicles and inflow
     vehicles = VehicleParams()
 
@@ -36,35 +39,39 @@ def main(args):
              car_following_params=SumoCarFollowingParams(
                  speed_mode="obey_safe_speed"),  # we use the speed mode "obey_safe_speed" for better dynamics at the merge
              routing_controller=(curbsideRouter, {}),
-             num_vehicles=10)
+             num_vehicles=num_humans)
 
     vehicles.add(veh_id="rl",
                  acceleration_controller=(RLController, {}),
                  routing_controller=(curbsideRouter, {}),
                  lane_change_controller=(curbsideLaneChangeController, {}),
-                 num_vehicles=1)
+                 num_vehicles=num_rl)
 
     # other parameters
 
-    additional_net_params = ADDITIONAL_NET_PARAMS.copy()
-    #additional_net_params["length_inflow"] = 50
-    #additional_net_params['number_parking_zones'] = 10
+    net_params_dict = ADDITIONAL_NET_PARAMS.copy()
+    net_params_dict.update(additional_net_params or {})
+    #net_params_dict["length_inflow"] = 50
+    #net_params_dict['number_parking_zones'] = 10
 
     net_params = NetParams(#inflows=inflow,  # our inflows
-                           additional_params=additional_net_params)
+                           additional_params=net_params_dict)
     sim_params = SumoParams(render=False,
                              sim_step=0.2,
                              save_render=False,
                             restart_instance=True,
-                            seed=10)
+                            seed=seed)
 
-    env_params = EnvParams(additional_params=ADDITIONAL_ENV_PARAMS)
+    env_params_dict = ADDITIONAL_ENV_PARAMS.copy()
+    env_params_dict.update(additional_env_params or {})
+
+    env_params = EnvParams(additional_params=env_params_dict)
 
     initial_config = InitialConfig(edges_distribution=["inflow"])
 
     flow_params = dict(
         exp_tag='curbside',
-        env_name=CurbsideTrafficEnv,
+        env_name=env_name or CurbsideTrafficEnv,
         network=curbsideNetwork,
         simulator='custom_traci',
         sim=sim_params,
@@ -75,15 +82,18 @@ def main(args):
     )
 
     # number of time steps
-    HORIZON = args.horizon
-    flow_params['env'].horizon = HORIZON
+    flow_params['env'].horizon = horizon
 
-    # number of parallel workers
-    N_CPUS = args.ncpu
-    # number of rollouts per training iteration
-    N_ROLLOUTS = 50 
+    return flow_params
 
-    ray.init(num_cpus=N_CPUS)
+
+def get_ppo_config(flow_params, n_cpus, n_rollouts=50, num_envs=1):
+    """PPO trainer class and config used for the curbside experiments."""
+    from ray import tune
+    from ray.rllib.agents.registry import get_agent_class
+    from flow.utils.rllib import FlowParamsEncoder
+
+    HORIZON = flow_params['env'].horizon
 
     # The algorithm or model to train. This may refer to "
     #      "the name of a built-on algorithm (e.g. RLLib's DQN "
@@ -93,8 +103,8 @@ def main(args):
 
     agent_cls = get_agent_class(alg_run)
     config = agent_cls._default_config.copy()
-    config["num_workers"] = N_CPUS - 1  # number of parallel workers
-    config["train_batch_size"] = HORIZON * N_ROLLOUTS  # batch size
+    config["num_workers"] = n_cpus - 1  # number of parallel workers
+    config["train_batch_size"] = HORIZON * n_rollouts  # batch size
     config["gamma"] = 0.999  # discount rate
     config["model"].update({"fcnet_hiddens": [16, 16]})  # size of hidden layers in network
     config["use_gae"] = True  # using generalized advantage estimation
@@ -103,6 +113,18 @@ def main(args):
     config["kl_target"] = 0.02  # target KL divergence
     config["num_sgd_iter"] = 50  # number of SGD iterations
     config["horizon"] = HORIZON  # rollout horizon
+    config["num_envs_per_worker"] = num_envs  # corridors stepped in lockstep per worker
+    config["seed"] = flow_params['sim'].seed
+
+    env_cls = flow_params['env_name']
+    if hasattr(env_cls, "agent_spaces"):
+        # one policy shared by all RL vehicles, so RLlib evaluates the
+        # observations of all agents as one batch
+        obs_space, act_space = env_cls.agent_spaces(flow_params['env'])
+        config["multiagent"] = dict(
+            config["multiagent"],
+            policies={"av": (None, obs_space, act_space, {})},
+            policy_mapping_fn=tune.function(lambda _: "av"))
 
     # save the flow params for replay
     flow_json = json.dumps(flow_params, cls=FlowParamsEncoder, sort_keys=True,
@@ -110,13 +132,89 @@ def main(args):
     config['env_config']['flow_params'] = flow_json  # adding the flow_params to config dict
     config['env_config']['run'] = alg_run
 
+    return alg_run, agent_cls, config
+
+
+def register_curbside_env(flow_params, simulator="sumo", num_envs=1):
+    """Register the curbside env with RLlib and return its name."""
+    from ray.tune.registry import register_env
+    from flow.utils.registry import make_create_env
+
+    from curbside_fastsim import make_create_fast_env
+    from curbside_vec_env import make_create_vector_env
+    from curbside_replay import make_seeded_create_env
+
     # Call the utility function make_create_env to be able to
     # register the Flow env for this experiment
-    create_env, gym_name = make_create_env(params=flow_params, version=0)
+    if simulator == "fast":
+        # SUMO-free NumPy backend, the SUMO path stays the validation backend
+        create_env, gym_name = make_create_fast_env(params=flow_params, version=0)
+    else:
+        create_env, gym_name = make_create_env(params=flow_params, version=0)
+
+    # RLlib makes the copies of multi-agent envs itself
+    if num_envs > 1 and not hasattr(flow_params['env_name'], "agent_spaces"):
+        create_env = make_create_vector_env(create_env, num_envs,
+                                            seed=flow_params['sim'].seed)
+    else:
+        # episode seeds derived from the base seed and the worker index
+        create_env = make_seeded_create_env(create_env, flow_params['sim'].seed)
 
     # Register as rllib env with Gym
     register_env(gym_name, create_env)
 
+    return gym_name
+
+
+def main(args):
+    if args.multiagent:
+        # flow's MultiEnv imports ray.rllib
+        from curbside_multiagent_env import CurbsideTrafficMultiEnv
+        env_name = CurbsideTrafficMultiEnv
+    else:
+        from curbside_env import CurbsideTrafficEnv
+        env_name = CurbsideTrafficEnv
+    net_params = {"net_cache": args.net_cache, "curb_spots": args.curb_spots}
+    vehicles = {}
+    if args.inflow:
+        # all vehicles enter from the arrival schedule
+        net_params["inflow"] = {"kind": args.inflow,
+                                "rate": args.inflow_rate,
+                                "rates": args.inflow_rates or [args.inflow_rate],
+                                "interval": args.inflow_interval,
+                                "path": args.inflow_trace,
+                                "rl_fraction": args.rl_fraction}
+        vehicles = {"num_humans": 0, "num_rl": 0}
+    flow_params = get_flow_params(args.horizon, env_name=env_name,
+                                  additional_net_params=net_params,
+                                  additional_env_params={"profile": args.profile,
+                                                         "warm_reset": args.warm_reset,
+                                                         "replay_cache": args.replay_cache},
+                                  seed=args.seed, **vehicles)
+    if args.dry_run:
+        from flow.utils.rllib import FlowParamsEncoder
+        print(json.dumps(flow_params, cls=FlowParamsEncoder, sort_keys=True, indent=4))
+        return
+
+    import ray
+    from ray.tune import run_experiments
+    from curbside_profiling import make_profiling_callbacks
+
+    # number of parallel workers
+    N_CPUS = args.ncpu
+    # number of rollouts per training iteration
+    N_ROLLOUTS = 50 
+
+    ray.init(num_cpus=N_CPUS)
+
+    alg_run, agent_cls, config = get_ppo_config(flow_params, N_CPUS, N_ROLLOUTS,
+                                                num_envs=args.num_envs)
+    if args.profile:
+        # report step timers as custom metrics
+        config["callbacks"] = make_profiling_callbacks()
+
+    gym_name = register_curbside_env(flow_params, args.simulator, args.num_envs)
+
     trials = run_experiments({
     flow_params["exp_tag"]: {
             "run": alg_run,
@@ -159,10 +257,89 @@ def create_parser():
         '--scenario',
         type=str,
         help='scenario to run')
+    parser.add_argument(
+        '--simulator',
+        type=str,
+        default='sumo',
+        choices=['sumo', 'fast'],
+        help='Simulation backend: SUMO or the NumPy corridor kernel')
+    parser.add_argument(
+        '--num_envs',
+        type=int,
+        default=1,
+        help='Number of environments stepped together in each worker')
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Time the env step hot path and report it as custom metrics')
+    parser.add_argument(
+        '--warm_reset',
+        action='store_true',
+        help='Reload the running SUMO instance on reset instead of restarting it')
+    parser.add_argument(
+        '--net_cache',
+        type=str,
+        help='Directory of cached network files shared by all workers')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=10,
+        help='Base seed, every worker and episode derives its own seed from it')
+    parser.add_argument(
+        '--replay_cache',
+        type=str,
+        help='Directory to store the seed, actions and inflow events of every '
+             'episode, for replays with visualizer_rllib.py --replay')
+    parser.add_argument(
+        '--inflow',
+        type=str,
+        choices=['poisson', 'varying', 'trace'],
+        help='Insert the vehicles from a precomputed arrival schedule')
+    parser.add_argument(
+        '--inflow_rate',
+        type=float,
+        default=600,
+        help='Arrival rate of the poisson schedule, in veh/hour')
+    parser.add_argument(
+        '--inflow_rates',
+        type=float,
+        nargs='+',
+        help='Arrival rates of the consecutive intervals of the varying schedule')
+    parser.add_argument(
+        '--inflow_interval',
+        type=float,
+        default=600,
+        help='Length of the intervals of the varying schedule, in s')
+    parser.add_argument(
+        '--inflow_trace',
+        type=str,
+        help='csv or npz arrival trace with a time column and optionally '
+             'type, pzone and tpark')
+    parser.add_argument(
+        '--rl_fraction',
+        type=float,
+        default=0.1,
+        help='Share of RL vehicles among the scheduled arrivals')
+    parser.add_argument(
+        '--curb_spots',
+        action='store_true',
+        help='NumPy kernel only (--simulator fast): park in variable-length '
+             'spots along one continuous curb instead of one slot per parking '
+             'zone. The SUMO network has no curb spots and rejects it')
+    parser.add_argument(
+        '--multiagent',
+        action='store_true',
+        help='Control every RL vehicle as an agent of one shared policy')
+    parser.add_argument(
+        '--dry_run',
+        action='store_true',
+        help='Print the flow params of the experiment and exit without starting Ray')
 
     return parser
 
 if __name__ == '__main__':
     parser = create_parser()
     args = parser.parse_args()
+    if args.curb_spots and args.simulator != 'fast':
+        parser.error('--curb_spots requires --simulator fast')
     main(args)
\ No newline at end of file
@@ -13,25 +13,14 @@ parser : ArgumentParser
 """
 
 import argparse
-import gym
+import collections
 import numpy as np
-import pandas as pd
 import os
+import random
 import sys
-import time
 
-import ray
-try:
-    from ray.rllib.agents.agent import get_agent_class
-except ImportError:
-    from ray.rllib.agents.registry import get_agent_class
-from ray.tune.registry import register_env
-
-from flow.core.util import emission_to_csv
-from flow.utils.registry import make_create_env
-from flow.utils.rllib import get_flow_params
-from flow.utils.rllib import get_rllib_config
-from flow.utils.rllib import get_rllib_pkl
+# gym, Ray, RLlib and flow are imported where they are used, so that --help
+# and the helpers imported by export_policy.py do not load them
 
 
 EXAMPLE_USAGE = """
@@ -41,9 +30,292 @@ example usage:
 Here the arguments are:
 1 - the path to the simulation results
 2 - the number of the checkpoint
+
+An episode stored with train.py --replay_cache is re-simulated with
+    python ./visualizer_rllib.py /ray_results/experiment_dir/result_dir 1 \\
+        --replay replay_cache/episode-123.npz --gen_emission
 """
 
 
+def _get_agent_class(alg):
+    try:
+        from ray.rllib.agents.agent import get_agent_class
+    except ImportError:
+        from ray.rllib.agents.registry import get_agent_class
+    return get_agent_class(alg)
+
+
+def _seed_policy(config, seed):
+    """Seed the sampling of policy actions, before the agent is built.
+
+    RLlib seeds the TF/torch graph of its workers from config["seed"], the
+    default graph and torch are seeded here as well for older versions.
+    """
+    config["seed"] = seed
+    if config.get("use_pytorch", False):
+        import torch
+        torch.manual_seed(seed)
+    else:
+        import tensorflow as tf
+        # tf.random.set_seed in TF 2
+        set_seed = getattr(tf, "set_random_seed", None) or tf.random.set_seed
+        set_seed(seed)
+
+
+def _local_worker(agent):
+    # the local evaluator was renamed to workers.local_worker() in later RLlib
+    if hasattr(agent, "workers"):
+        return agent.workers.local_worker()
+    return agent.local_evaluator
+
+
+class BatchedPolicy(object):
+    """Actions for many observations with one compute_actions call per policy.
+
+    Observations are preprocessed and filtered one by one, exactly as
+    ``agent.compute_action`` does, but the forward pass runs on the stacked
+    batch.  Box actions are clipped to the action space.  Recurrent states are kept per key, e.g. (env, agent id).
+    """
+
+    def __init__(self, agent):
+        worker = _local_worker(agent)
+        self.policies = worker.policy_map
+        self.preprocessors = worker.preprocessors
+        self.filters = worker.filters
+        self.default_policy = next(iter(self.policies)) \
+            if len(self.policies) == 1 else None
+        self.states = {}
+
+    def reset(self):
+        self.states = {}
+
+    def compute_actions(self, keys, obs, policy_ids):
+        """Actions for obs[n] of keys[n] under policy policy_ids[n]."""
+        actions = [None] * len(obs)
+        groups = collections.defaultdict(list)
+        for n, policy_id in enumerate(policy_ids):
+            groups[policy_id].append(n)
+
+        for policy_id, idx in groups.items():
+            policy = self.policies[policy_id]
+            prep = self.preprocessors[policy_id]
+            obs_filter = self.filters[policy_id]
+            batch = np.stack([obs_filter(prep.transform(obs[n]), update=False)
+                              for n in idx])
+
+            init = policy.get_initial_state()
+            state_batches = []
+            if init:
+                states = [self.states.get(keys[n], init) for n in idx]
+                state_batches = [np.stack(s) for s in zip(*states)]
+
+            out, state_out, _ = policy.compute_actions(batch, state_batches)
+            space = policy.action_space
+            if hasattr(space, "low"):
+                # as agent.compute_action with clip_actions
+                out = np.clip(out, space.low, space.high)
+            for m, n in enumerate(idx):
+                actions[n] = out[m]
+                if init:
+                    self.states[keys[n]] = [s[m] for s in state_out]
+        return actions
+
+
+def _swap_rng(state):
+    """Install a (random, np.random) state, returns the one it replaces."""
+    old = random.getstate(), np.random.get_state()
+    random.setstate(state[0])
+    np.random.set_state(state[1])
+    return old
+
+
+def run_rollouts(envs, policy, indices, horizon, multiagent, policy_map_fn=None,
+                 policy_keys=(), recorder=None, seeds=None):
+    """Run one evaluation rollout per env, stepping all envs in lockstep.
+
+    The observations of every agent in every running env are stacked into
+    one batch per policy each step.  With seeds, every env steps with its
+    own random/np.random state, so its simulation does not depend on the
+    envs it is batched with.  Returns one dict per env with the return and
+    traffic metrics of its rollout.
+    """
+    states = []
+    rng = [None] * len(envs)
+    for k, env in enumerate(envs):
+        if seeds is not None:
+            # flow draws the seed of a restarted simulation from random
+            random.seed(seeds[k])
+            np.random.seed(seeds[k])
+        states.append(env.reset())
+        if seeds is not None:
+            rng[k] = random.getstate(), np.random.get_state()
+    policy.reset()
+
+    vel = [[] for _ in envs]
+    if multiagent:
+        rets = [{key: [0] for key in policy_keys} for _ in envs]
+    else:
+        rets = [0 for _ in envs]
+    running = list(range(len(envs)))
+
+    for j in range(horizon):
+        if not running:
+            break
+
+        keys, obs, policy_ids = [], [], []
+        for k in running:
+            vehicles = envs[k].unwrapped.k.vehicle
+            speeds = vehicles.get_speed(vehicles.get_ids())
+
+            # only include non-empty speeds
+            if speeds:
+                vel[k].append(np.mean(speeds))
+
+            if multiagent:
+                for agent_id, agent_obs in states[k].items():
+                    keys.append((k, agent_id))
+                    obs.append(agent_obs)
+                    policy_ids.append(policy_map_fn(agent_id))
+            else:
+                keys.append((k, None))
+                obs.append(states[k])
+                policy_ids.append(policy.default_policy)
+
+        actions = {k: {} for k in running}
+        for (k, agent_id), action in zip(keys, policy.compute_actions(keys, obs, policy_ids)):
+            if multiagent:
+                actions[k][agent_id] = action
+            else:
+                actions[k] = action
+
+        for k in list(running):
+            if seeds is not None:
+                outer = _swap_rng(rng[k])
+            states[k], reward, done, _ = envs[k].step(actions[k])
+            if seeds is not None:
+                rng[k] = _swap_rng(outer)
+            if multiagent:
+                for actor, rew in reward.items():
+                    rets[k][policy_map_fn(actor)][0] += rew
+            else:
+                rets[k] += reward
+
+            if recorder is not None:
+                recorder.record(envs[k].unwrapped, indices[k], j, reward)
+
+            if done['__all__'] if multiagent else done:
+                running.remove(k)
+
+    results = []
+    for k, env in enumerate(envs):
+        vehicles = env.unwrapped.k.vehicle
+        results.append({"index": indices[k],
+                        "ret": rets[k],
+                        "outflow": vehicles.get_outflow_rate(500),
+                        "inflow": vehicles.get_inflow_rate(500),
+                        "mean_speed": np.mean(vel[k]),
+                        "std_speed": np.std(vel[k])})
+    return results
+
+
+def rollout_groups(num_rollouts, size):
+    """Split the rollout indices into groups that are run in lockstep."""
+    return [list(range(s, min(num_rollouts, s + size)))
+            for s in range(0, num_rollouts, size)]
+
+
+class RolloutActor(object):
+    """Evaluation worker with its own agent copy, envs and rollout recorder."""
+
+    def __init__(self, agent_cls, env_name, create_env, config, agent_state,
+                 args, actor_index):
+        import gym
+        from ray.tune.registry import register_env
+
+        register_env(env_name, create_env)
+        # every actor samples its actions from its own seeded generator
+        config = dict(config)
+        _seed_policy(config, (args.seed or 0) + actor_index)
+        self.agent = agent_cls(env=env_name, config=config)
+        # same state as the driver's agent, without reading the checkpoint again
+        self.agent.__setstate__(agent_state)
+        self.policy = BatchedPolicy(self.agent)
+        self.envs = [gym.make(env_name) for _ in range(args.batch_envs)]
+        subdir = 'actor_{}'.format(actor_index)
+        self.recorder = make_recorder(
+            args, os.path.join(args.output, subdir),
+            os.path.join(emission_dir(self.envs[0].unwrapped.network.name), subdir))
+
+    def rollout(self, indices, seeds, rollout_args):
+        return run_rollouts(self.envs[:len(indices)], self.policy, indices,
+                            *rollout_args, recorder=self.recorder, seeds=seeds)
+
+    def close(self):
+        self.recorder.close()
+        for env in self.envs:
+            env.unwrapped.terminate()
+
+
+def parallel_rollouts(args, agent, agent_cls, env_name, create_env, config,
+                      rollout_args):
+    """Run args.num_rollouts rollouts over args.parallel Ray actors."""
+    import ray
+
+    agent_state = agent.__getstate__()
+    remote_actor = ray.remote(RolloutActor)
+    actors = [remote_actor.remote(agent_cls, env_name, create_env, config,
+                                  agent_state, args, k)
+              for k in range(args.parallel)]
+
+    seed = args.seed or 0
+    groups = rollout_groups(args.num_rollouts, args.batch_envs)
+    results = ray.get([actors[g % args.parallel].rollout.remote(
+                           indices, [seed + i for i in indices], rollout_args)
+                       for g, indices in enumerate(groups)])
+    ray.get([actor.close.remote() for actor in actors])
+    return [res for group in results for res in group]
+
+
+def make_recorder(args, output, emission_path):
+    """Rollout records, and the emission data with --gen_emission."""
+    from curbside_recorder import EmissionWriter, RecorderGroup, RolloutRecorder
+
+    emission = None
+    if args.gen_emission:
+        emission = EmissionWriter(emission_path, chunk_size=args.chunk_size,
+                                  fmt=args.emission_format)
+    return RecorderGroup(RolloutRecorder(output, chunk_size=args.chunk_size,
+                                         fmt=args.output_format), emission)
+
+
+def emission_dir(network_name):
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    return '{0}/test_time_rollout/{1}-emission'.format(dir_path, network_name)
+
+
+def replay(args, env_name):
+    """Re-simulate a recorded episode instead of rolling out the policy."""
+    import gym
+    from curbside_replay import load_episode, replay_episode
+
+    env = gym.make(env_name)
+    record = load_episode(args.replay)
+    recorder = make_recorder(args, args.output, emission_dir(env.unwrapped.network.name))
+    diverged = replay_episode(env, record, recorder)
+    recorder.close()
+
+    print('Replayed episode with seed {} ({} steps)'.format(
+        int(record['seed']), int(record['num_steps'])))
+    if diverged:
+        print('Inflow diverged from the record at {} events, first: {}'.format(
+            len(diverged), diverged[0]))
+    print("\nRollout records written to " + args.output)
+    if args.gen_emission:
+        print("Emission data written to " + emission_dir(env.unwrapped.network.name))
+
+    env.unwrapped.terminate()
+
+
 def visualizer_rllib(args):
     """Visualizer for RLlib experiments.
 
@@ -51,6 +323,13 @@ def visualizer_rllib(args):
     more detailed information on what information can be fed to this
     visualizer), and renders the experiment associated with it.
     """
+    import gym
+    from ray.tune.registry import register_env
+    from flow.utils.registry import make_create_env
+    from flow.utils.rllib import get_flow_params
+    from flow.utils.rllib import get_rllib_config
+    from flow.utils.rllib import get_rllib_pkl
+
     result_dir = args.result_dir if args.result_dir[-1] != '/' \
         else args.result_dir[:-1]
 
@@ -90,9 +369,9 @@ def visualizer_rllib(args):
                   + '\'{}\''.format(config_run))
             sys.exit(1)
     if args.run:
-        agent_cls = get_agent_class(args.run)
+        agent_cls = _get_agent_class(args.run)
     elif config_run:
-        agent_cls = get_agent_class(config_run)
+        agent_cls = _get_agent_class(config_run)
     else:
         print('visualizer_rllib.py: error: could not find flow parameter '
               '\'run\' in params.json, '
@@ -102,9 +381,8 @@ def visualizer_rllib(args):
         sys.exit(1)
 
     sim_params.restart_instance = True
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    emission_path = '{0}/test_time_rollout/'.format(dir_path)
-    sim_params.emission_path = emission_path if args.gen_emission else None
+    # emission data is written from the kernel, see EmissionWriter
+    sim_params.emission_path = None
 
     # pick your rendering mode
     if args.render_mode == 'sumo_web3d':
@@ -149,7 +427,13 @@ def visualizer_rllib(args):
         config['horizon'] = args.horizon
         env_params.horizon = args.horizon
 
+    if args.replay:
+        replay(args, env_name)
+        return
+
     # create the agent that will be used to compute the actions
+    if args.seed is not None:
+        _seed_policy(config, args.seed)
     agent = agent_cls(env=env_name, config=config)
     checkpoint = result_dir + '/checkpoint_' + args.checkpoint_num
     checkpoint = checkpoint + '/checkpoint-' + args.checkpoint_num
@@ -173,24 +457,6 @@ def visualizer_rllib(args):
     else:
         rets = []
 
-    if config['model']['use_lstm']:
-        use_lstm = True
-        if multiagent:
-            state_init = {}
-            # map the agent id to its policy
-            policy_map_fn = config['multiagent']['policy_mapping_fn'].func
-            size = config['model']['lstm_cell_size']
-            for key in config['multiagent']['policies'].keys():
-                state_init[key] = [np.zeros(size, np.float32),
-                                   np.zeros(size, np.float32)]
-        else:
-            state_init = [
-                np.zeros(config['model']['lstm_cell_size'], np.float32),
-                np.zeros(config['model']['lstm_cell_size'], np.float32)
-            ]
-    else:
-        use_lstm = False
-
     # if restart_instance, don't restart here because env.reset will restart later
     if not sim_params.restart_instance:
         env.restart_simulation(sim_params=sim_params, render=sim_params.render)
@@ -201,81 +467,51 @@ def visualizer_rllib(args):
     mean_speed = []
     std_speed = []
 
-    state_translation = {"inflow":0,"slowing":1,"parking":2,"parked":3, "outflow":4}
-
-    custom_outputs = {k:np.zeros(env_params.horizon*args.num_rollouts) for k in 
-                      ["num_rollout", "t", "speed", "position", "state", "reward"]}
-
-    for i in range(args.num_rollouts):
-        vel = []
-        state = env.reset()
-
-
-        if multiagent:
-            ret = {key: [0] for key in rets.keys()}
-        else:
-            ret = 0
-        for j in range(env_params.horizon):
-            vehicles = env.unwrapped.k.vehicle
-            speeds = vehicles.get_speed(vehicles.get_ids())
-
-            # only include non-empty speeds
-            if speeds:
-                vel.append(np.mean(speeds))
-
-            if multiagent:
-                action = {}
-                for agent_id in state.keys():
-                    if use_lstm:
-                        action[agent_id], state_init[agent_id], logits = \
-                            agent.compute_action(
-                            state[agent_id], state=state_init[agent_id],
-                            policy_id=policy_map_fn(agent_id))
-                    else:
-                        action[agent_id] = agent.compute_action(
-                            state[agent_id], policy_id=policy_map_fn(agent_id))
-            else:
-                action = agent.compute_action(state)
-            state, reward, done, _ = env.step(action)
-            if multiagent:
-                for actor, rew in reward.items():
-                    ret[policy_map_fn(actor)][0] += rew
-            else:
-                ret += reward
-            if multiagent and done['__all__']:
-                break
-            if not multiagent and done:
-                break
-
-
-            #"num_rollout", "t", "speed", "position", "state", "reward"]}
-            m = i*env_params.horizon + j
-            custom_outputs["num_rollout"][m] = i
-            custom_outputs["t"][m] = j
-            custom_outputs["reward"][m] = reward
-
-            veh_id = vehicles.get_ids()[0]
-            custom_outputs["speed"][m] = vehicles.get_speed(veh_id)
-            custom_outputs["position"][m] = vehicles.get_global_position(veh_id, env)
-            custom_outputs["state"][m] = state_translation.get(vehicles.get_state(veh_id), -1)        
-
-
+    policy_keys = list(rets.keys()) if multiagent else []
+    if not multiagent:
+        policy_map_fn = None
+    rollout_args = (env_params.horizon, multiagent, policy_map_fn, policy_keys)
+
+    if args.parallel > 1 and args.render_mode == 'no_render':
+        # the actors write to sub-directories, so the parts of an earlier
+        # serial run are cleared here
+        from curbside_recorder import clear_parts
+        clear_parts(args.output)
+        if args.gen_emission:
+            clear_parts(emission_dir(env.network.name))
+        # fan the rollouts out to actors that each own an env
+        results = parallel_rollouts(args, agent, agent_cls, env_name, create_env,
+                                    config, rollout_args)
+    else:
+        # per-step, per-vehicle records, streamed to disk in chunks
+        recorder = make_recorder(args, args.output, emission_dir(env.network.name))
+        policy = BatchedPolicy(agent)
+        # extra envs stepped in lockstep with the first one
+        envs = [env]
+        if args.render_mode == 'no_render':
+            envs += [gym.make(env_name) for _ in range(args.batch_envs - 1)]
+
+        results = []
+        for indices in rollout_groups(args.num_rollouts, len(envs)):
+            seeds = None if args.seed is None else [args.seed + i for i in indices]
+            results += run_rollouts(envs[:len(indices)], policy, indices, *rollout_args,
+                                    recorder=recorder, seeds=seeds)
+        recorder.close()
+        for extra_env in envs[1:]:
+            extra_env.unwrapped.terminate()
+
+    # merge in rollout order, independently of which worker ran what
+    for res in sorted(results, key=lambda r: r["index"]):
+        i, ret = res["index"], res["ret"]
         if multiagent:
             for key in rets.keys():
                 rets[key].append(ret[key])
         else:
             rets.append(ret)
-        outflow = vehicles.get_outflow_rate(500)
-        final_outflows.append(outflow)
-        inflow = vehicles.get_inflow_rate(500)
-        final_inflows.append(inflow)
-        if np.all(np.array(final_inflows) > 1e-5):
-            throughput_efficiency = [x / y for x, y in
-                                     zip(final_outflows, final_inflows)]
-        else:
-            throughput_efficiency = [0] * len(final_inflows)
-        mean_speed.append(np.mean(vel))
-        std_speed.append(np.std(vel))
+        final_outflows.append(res["outflow"])
+        final_inflows.append(res["inflow"])
+        mean_speed.append(res["mean_speed"])
+        std_speed.append(res["std_speed"])
         if multiagent:
             for agent_id, rew in rets.items():
                 print('Round {}, Return: {} for agent {}'.format(
@@ -283,6 +519,12 @@ def visualizer_rllib(args):
         else:
             print('Round {}, Return: {}'.format(i, ret))
 
+    if np.all(np.array(final_inflows) > 1e-5):
+        throughput_efficiency = [x / y for x, y in
+                                 zip(final_outflows, final_inflows)]
+    else:
+        throughput_efficiency = [0] * len(final_inflows)
+
     print('==== Summary of results ====')
     print("Return:")
     print(mean_speed)
@@ -322,31 +564,13 @@ def visualizer_rllib(args):
     print('Average, std: {}, {}'.format(np.mean(throughput_efficiency),
                                         np.std(throughput_efficiency)))
 
-    df = pd.DataFrame(custom_outputs)
-    df.to_csv("output.csv")
-
-    # terminate the environment
-    env.unwrapped.terminate()
+    print("\nRollout records written to " + args.output)
 
-    # if prompted, convert the emission file into a csv file
     if args.gen_emission:
-        time.sleep(0.1)
-
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-        emission_filename = '{0}-emission.xml'.format(env.network.name)
-
-        emission_path = \
-            '{0}/test_time_rollout/{1}'.format(dir_path, emission_filename)
-
-        # convert the emission file into a csv file
-        emission_to_csv(emission_path)
+        print("Emission data written to " + emission_dir(env.network.name))
 
-        # print the location of the emission csv file
-        emission_path_csv = emission_path[:-4] + ".csv"
-        print("\nGenerated emission file at " + emission_path_csv)
-
-        # delete the .xml version of the emission file
-        os.remove(emission_path)
+    # terminate the environment
+    env.unwrapped.terminate()
 
 
 def create_parser():
@@ -379,7 +603,7 @@ def create_parser():
     parser.add_argument(
         '--gen_emission',
         action='store_true',
-        help='Specifies whether to generate an emission file from the '
+        help='Specifies whether to generate emission data from the '
              'simulation')
     parser.add_argument(
         '--evaluate',
@@ -401,11 +625,60 @@ def create_parser():
         '--horizon',
         type=int,
         help='Specifies the horizon.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='output',
+        help='Directory for the per-step, per-vehicle rollout records.')
+    parser.add_argument(
+        '--output_format',
+        type=str,
+        default='npz',
+        choices=['npz', 'parquet', 'csv'],
+        help='File format of the rollout record chunks.')
+    parser.add_argument(
+        '--emission_format',
+        type=str,
+        default='csv',
+        choices=['csv', 'parquet', 'npz'],
+        help='File format of the emission data chunks (--gen_emission).')
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=100000,
+        help='Number of records buffered in memory before they are written.')
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=1,
+        help='Number of processes running rollouts in parallel '
+             '(only with --render_mode no_render).')
+    parser.add_argument(
+        '--batch_envs',
+        type=int,
+        default=1,
+        help='Number of envs per process stepped in lockstep, with the '
+             'actions of all their agents computed in one batch '
+             '(only with --render_mode no_render).')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Base seed, rollout i is seeded with seed + i and the policy '
+             'of actor k with seed + k. Defaults to 0 with --parallel. '
+             'Simulations do not depend on --batch_envs/--parallel, the '
+             'sampled actions of a stochastic policy only repeat with the '
+             'same batching.')
+    parser.add_argument(
+        '--replay',
+        type=str,
+        help='Episode record (.npz) of a replay cache to re-simulate instead '
+             'of rolling out the policy.')
     return parser
 
 
 if __name__ == '__main__':
     parser = create_parser()
     args = parser.parse_args()
-    ray.init(num_cpus=1)
+    import ray
+    ray.init(num_cpus=max(1, args.parallel) + (args.parallel > 1))
     visualizer_rllib(args)